@@ -0,0 +1,147 @@
+import copy
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+# ========= הגדרות =========
+
+AI_CACHE_ENABLED = os.environ.get("AI_CACHE_ENABLED", "1") == "1"
+AI_CACHE_MAX_ENTRIES = int(os.environ.get("AI_CACHE_MAX_ENTRIES", 5000))
+AI_CACHE_TTL = float(os.environ.get("AI_CACHE_TTL", 6 * 3600))
+AI_CACHE_FILE = os.environ.get("AI_CACHE_FILE", "")  # ריק = בלי שמירה לדיסק
+# הודעות ארוכות כמעט לא חוזרות על עצמן - לא שווה לשמור אותן
+AI_CACHE_MAX_TEXT_LENGTH = int(os.environ.get("AI_CACHE_MAX_TEXT_LENGTH", 60))
+# temperature=0 לבקשות שנכנסות לקאש, כדי שהתשובה השמורה תהיה "התשובה" ולא דגימה אקראית אחת
+AI_CACHE_DETERMINISTIC = os.environ.get("AI_CACHE_DETERMINISTIC", "1") == "1"
+
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_text(text: str) -> str:
+    return _WS_RE.sub(" ", text.strip().lower()).strip(" .!?,")
+
+
+def atomic_write_json(path: str, data: Any):
+    """
+    כותב JSON לקובץ זמני באותה תיקייה ואז מחליף (rename) - קורא לעולם לא יראה קובץ חצי כתוב.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp-", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf8") as f:
+            json.dump(data, f, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class AIResponseCache:
+    """
+    LRU עם TTL לתשובות ה-AI. המפתח הוא הטקסט המנורמל + המצב הנוכחי של המשלוח,
+    כך ש"כן" כשעוד לא נאסף כלום מקבל את אותה תשובה בלי קריאה ל-OpenAI.
+    """
+
+    def __init__(self, max_entries: int = AI_CACHE_MAX_ENTRIES, ttl_seconds: float = AI_CACHE_TTL,
+                 path: str = AI_CACHE_FILE, max_text_length: int = AI_CACHE_MAX_TEXT_LENGTH):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self.max_text_length = max_text_length
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+        if path:
+            self.load()
+
+    def is_cacheable(self, text: str) -> bool:
+        return len(text) <= self.max_text_length
+
+    @staticmethod
+    def make_key(text: str, current_state: Dict[str, Any]) -> str:
+        raw = normalize_text(text) + "\x00" + json.dumps(current_state, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha1(raw.encode("utf8")).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, value = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        # עותק, כדי שמי שמשנה את התשובה לא ישנה את מה שבקאש
+        return copy.deepcopy(value)
+
+    def set(self, key: str, value: Dict[str, Any]):
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl_seconds, copy.deepcopy(value))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+    # ---- שמירה לדיסק ----
+
+    def save(self):
+        if not self.path:
+            return
+        now = time.time()
+        with self._lock:
+            items = [[k, exp, v] for k, (exp, v) in self._entries.items() if exp > now]
+        try:
+            atomic_write_json(self.path, items)
+        except OSError as e:
+            print("❌ שגיאה בשמירת קאש ה-AI:", e)
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf8") as f:
+                items = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print("❌ שגיאה בטעינת קאש ה-AI:", e)
+            return
+        now = time.time()
+        with self._lock:
+            for key, expires_at, value in items[-self.max_entries:]:
+                if expires_at > now:
+                    self._entries[key] = (expires_at, value)
+
+
+ai_cache = AIResponseCache() if AI_CACHE_ENABLED else None
@@ -1,16 +1,33 @@
 import streamlit as st
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, date, timedelta
 from services import (
-    send_whatsapp_message,
-    load_data,
-    save_data,
-    calculate_time_range,
+    send_whatsapp_bulk,
     normalize_phone
 )
+import store
+import time
+import threading
+from eta import compute_route_windows, recompute_remaining_windows
+from route_optimizer import create_geocoder, plan_route
+from route_import import import_route_file
+from phones import allowlist
+from retention import find_archived_deliveries
+from live_events import LiveFeed
 import uuid 
 import os 
 
+# מסך הצפייה: כל כמה שניות לבדוק אם יש עדכונים, וכמה שורות בעמוד
+VIEW_REFRESH_SECONDS = int(os.environ.get("VIEW_REFRESH_SECONDS", 5))
+VIEW_PAGE_SIZE = int(os.environ.get("VIEW_PAGE_SIZE", 50))
+# כתובת webhook_server לעדכונים חיים (SSE). אם מוגדרת - הטבלה מתעדכנת תוך שנייה מהאירועים,
+# ובדיקת הגרסה ב-DB נשארת רק כרשת ביטחון (למשל למסלולים חדשים שנוצרו כאן ב-app)
+LIVE_EVENTS_URL = os.environ.get("LIVE_EVENTS_URL", "")
+# אותו סוד שמוגדר ב-webhook_server (INTERNAL_API_TOKEN) - בלעדיו /events מחזיר 403
+INTERNAL_API_TOKEN = os.environ.get("INTERNAL_API_TOKEN", "")
+LIVE_FALLBACK_POLL_SECONDS = int(os.environ.get("LIVE_FALLBACK_POLL_SECONDS", 30))
+VIEW_TICK_SECONDS = 1 if LIVE_EVENTS_URL else VIEW_REFRESH_SECONDS
+
 # עיצוב RTL והתאמות לטבלה
 st.markdown("""
 <style>
@@ -25,18 +42,138 @@ th {
 </style>
 """, unsafe_allow_html=True)
 
-# --- אתחול נתונים חכם (תיקון השגיאה) ---
-if "all_batches" not in st.session_state:
-    data = load_data()
-    # בדיקה קריטית: אם הנתונים הם רשימה (גרסה ישנה), נאפס למילון
-    if isinstance(data, list):
-        st.session_state["all_batches"] = {}
-    else:
-        st.session_state["all_batches"] = data
+# --- טעינת המשלוחים של שליח (בלי לטעון את כל ה-DB) ---
+@st.cache_data(max_entries=64, show_spinner=False)
+def load_dispatcher_view(dispatcher_phone, store_version, active_only, date_from, date_to):
+    # store_version הוא חלק ממפתח הקאש בלבד: כל עוד ה-store לא השתנה, התשובה נשמרת
+    return store.query_dispatcher_deliveries(dispatcher_phone, active_only, date_from, date_to)
+
+
+# --- גיאוקודר עם קאש בדיסק, אחד לכל ה-sessions ---
+@st.cache_resource
+def get_geocoder():
+    return create_geocoder()
+
+
+def _merge_row(view, batch_id, idx, delivery, active_only):
+    # משלוחים ממסלולים שלא מוצגים (סגורים) לא נכנסים באמצע, רק עדכונים ומסלולים חדשים
+    if (batch_id, idx) in view["rows"] or not active_only or delivery.get("status") not in store.INACTIVE_STATUSES:
+        view["rows"][(batch_id, idx)] = delivery
+
+
+def _in_date_range(batch_id, date_from, date_to):
+    day = batch_id[len("ROUTE-"):len("ROUTE-") + 8]
+    return (not date_from or day >= date_from) and (not date_to or day <= date_to)
+
+
+# --- חיבור SSE אחד לכל שליח, משותף לכל ה-sessions (חיבור שאף מסך לא קורא ממנו נסגר לבד) ---
+@st.cache_resource
+def get_live_feeds():
+    return {"lock": threading.Lock(), "feeds": {}}
+
+
+def _get_live_feed(dispatcher_phone):
+    registry = get_live_feeds()
+    with registry["lock"]:
+        feed = registry["feeds"].get(dispatcher_phone)
+        if feed is None or not feed.alive:
+            feed = LiveFeed(LIVE_EVENTS_URL, dispatcher_phone, INTERNAL_API_TOKEN).start()
+            registry["feeds"][dispatcher_phone] = feed
+    return feed
+
+
+def _read_live_feed(feed):
+    # המיקום של ה-session הזה בחוצץ של החיבור המשותף. חיבור חדש (הקודם נסגר) = ייתכן שפספסנו אירועים
+    last_feed, cursor = st.session_state.get("live_cursor", (None, 0))
+    if last_feed is not feed:
+        st.session_state["live_cursor"] = (feed, feed.position)
+        return [("reset", {})]
+    position, items = feed.read(cursor)
+    st.session_state["live_cursor"] = (feed, position)
+    return items
+
+
+def get_dispatcher_rows(dispatcher_phone, active_only, date_from, date_to):
+    """
+    מחזיר {(batch_id, idx): delivery} למסך השליח. בטעינה ראשונה (או כשהסינון משתנה) - שאילתה מלאה;
+    אחר כך רק השורות שהשתנו: מאירועי SSE אם יש עדכונים חיים, ומה-DB לפי גרסת ה-store.
+    """
+    key = (dispatcher_phone, active_only, date_from, date_to)
+    view = st.session_state.get("dispatcher_view")
+    feed = _get_live_feed(dispatcher_phone) if LIVE_EVENTS_URL else None
+    
+    if feed is not None and view is not None and view["key"] == key:
+        for event, data in _read_live_feed(feed):
+            if event == "reset":
+                # פספסנו אירועים (ניתוק ארוך) - טעינה מלאה
+                view = None
+                break
+            if event == "delivery" and _in_date_range(data["batch_id"], date_from, date_to):
+                _merge_row(view, data["batch_id"], data["idx"], data["delivery"], active_only)
+    
+    poll_every = LIVE_FALLBACK_POLL_SECONDS if feed is not None and feed.connected else VIEW_REFRESH_SECONDS
+    if view is None or view["key"] != key:
+        if feed is not None:
+            _read_live_feed(feed)  # הטעינה המלאה כבר כוללת את מה שחיכה בחוצץ
+        version = store.get_store_version()
+        rows = load_dispatcher_view(dispatcher_phone, version, active_only, date_from, date_to)
+        view = {"key": key, "version": version, "checked_at": time.monotonic(),
+                "rows": {(b, i): d for b, i, d in rows}}
+    elif time.monotonic() - view["checked_at"] >= poll_every:
+        version = store.get_store_version()
+        if view["version"] != version:
+            changed = store.query_dispatcher_deliveries(dispatcher_phone, active_only=False, date_from=date_from,
+                                                        date_to=date_to, changed_since=view["version"])
+            for b, i, d in changed:
+                _merge_row(view, b, i, d, active_only)
+            view["version"] = version
+        view["checked_at"] = time.monotonic()
+    
+    st.session_state["dispatcher_view"] = view
+    return view["rows"]
+
+
+@st.fragment(run_every=VIEW_TICK_SECONDS)
+def render_dispatcher_table(dispatcher_phone, active_only, date_from, date_to):
+    rows = get_dispatcher_rows(dispatcher_phone, active_only, date_from, date_to)
+    
+    if not rows:
+        st.warning("לא נמצאו משלוחים למספר זה.")
+        return
+    
+    # המרה ל-DF ומיון
+    df = pd.DataFrame(list(rows.values()))
+    
+    # מיון לפי ה-Batch ID (שהוא זמן) ואז לפי המספר הסידורי
+    df = df.sort_values(by=["batch_id", "sequence_number"], ascending=[False, True])
+    
+    st.subheader(f"סה״כ משלוחים פעילים: {len(df)}")
+    
+    # עימוד
+    pages = max(1, (len(df) + VIEW_PAGE_SIZE - 1) // VIEW_PAGE_SIZE)
+    if pages > 1:
+        page_num = st.number_input(f"עמוד (מתוך {pages})", min_value=1, max_value=pages, value=1, step=1)
+        df = df.iloc[(page_num - 1) * VIEW_PAGE_SIZE: page_num * VIEW_PAGE_SIZE]
+    
+    # תצוגה נקייה לשליח
+    df_show = df.reindex(columns=[
+        "sequence_number", "recipient_name", "recipient_phone", "someone_home", 
+        "drop_location", "floor", "apartment", "entrance_code", "status"
+    ]).rename(columns={
+        "sequence_number": "מס'",
+        "recipient_name": "שם",
+        "recipient_phone": "טלפון",
+        "someone_home": "בבית?",
+        "drop_location": "איפה להשאיר",
+        "floor": "קומה",
+        "apartment": "דירה",
+        "entrance_code": "קוד",
+        "status": "סטטוס"
+    })
+    
+    # שימוש ב-dataframe אינטראקטיבי
+    st.dataframe(df_show, hide_index=True)
 
-# הגנה נוספת: ודא שזה מילון בכל מקרה
-if not isinstance(st.session_state["all_batches"], dict):
-    st.session_state["all_batches"] = {}
 
 # אתחול רשימה זמנית לבניית המסלול (אם לא קיימת)
 if "temp_route_list" not in st.session_state:
@@ -73,7 +210,7 @@ if page == "בניית מסלול (הזנה)":
 
     # --- טופס הוספת משלוח (שורה אחת) ---
     with st.form(key="add_delivery_form", clear_on_submit=True):
-        c1, c2, c3 = st.columns([1, 2, 2])
+        c1, c2, c3, c4 = st.columns([1, 2, 2, 3])
         
         with c1:
             # השליח יכול לשנות את המספר ידנית אם יש כפילות
@@ -82,9 +219,40 @@ if page == "בניית מסלול (הזנה)":
             name_input = st.text_input("שם הנמען (אופציונלי)")
         with c3:
             phone_input = st.text_input("טלפון (חובה)")
+        with c4:
+            address_input = st.text_input("כתובת (לסידור אוטומטי)")
             
         add_btn = st.form_submit_button("➕ הוסף לרשימה")
 
+    # --- ייבוא רשימה שלמה מקובץ ---
+    with st.expander("📂 ייבוא משלוחים מקובץ (CSV / Excel)"):
+        st.caption("עמודות: טלפון (חובה), שם, מס' סידורי, כתובת")
+        uploaded = st.file_uploader("בחר קובץ", type=["csv", "xlsx"])
+        if uploaded is not None and st.button("📥 ייבא לרשימה"):
+            try:
+                result = import_route_file(
+                    uploaded.getvalue(), uploaded.name,
+                    existing_phones=[item["phone"] for item in current_list],
+                    allowed_numbers=allowlist.numbers,
+                    first_seq=next_seq,
+                )
+            except ValueError as e:
+                st.error(f"❌ {e}")
+            else:
+                st.session_state["temp_route_list"].extend(result["items"])
+                st.session_state["import_result"] = {"added": len(result["items"]), "errors": result["errors"]}
+                st.rerun()
+        import_result = st.session_state.get("import_result")
+        if import_result:
+            st.success(f"✅ נוספו {import_result['added']} משלוחים מהקובץ.")
+            if import_result["errors"]:
+                st.warning(f"⚠️ {len(import_result['errors'])} שורות לא יובאו:")
+                st.dataframe(
+                    pd.DataFrame(import_result["errors"]).rename(columns={"row": "שורה", "phone": "טלפון", "error": "שגיאה"}),
+                    use_container_width=True,
+                    hide_index=True
+                )
+
     # --- לוגיקה בהוספה ---
     if add_btn:
         if not phone_input:
@@ -94,7 +262,8 @@ if page == "בניית מסלול (הזנה)":
             new_item = {
                 "seq": seq_input,
                 "name": name_input if name_input else "לקוח",
-                "phone": normalize_phone(phone_input)
+                "phone": normalize_phone(phone_input),
+                "address": address_input.strip()
             }
             st.session_state["temp_route_list"].append(new_item)
             st.rerun() # ריענון כדי לעדכן את הטבלה ואת המספר הסידורי הבא
@@ -108,16 +277,35 @@ if page == "בניית מסלול (הזנה)":
         
         # תצוגה בטבלה
         st.dataframe(
-            df.rename(columns={"seq": "מס'", "name": "שם", "phone": "טלפון"}),
+            df.drop(columns=["leg_minutes"], errors="ignore")
+              .rename(columns={"seq": "מס'", "name": "שם", "phone": "טלפון", "address": "כתובת"}),
             use_container_width=True,
             hide_index=True
         )
         
+        # --- סידור אוטומטי לפי כתובות (אופציונלי) ---
+        with st.expander("🧭 סידור מסלול אוטומטי לפי כתובות"):
+            start_address = st.text_input("כתובת יציאה (אופציונלי)")
+            if st.button("סדר את המסלול"):
+                with st.spinner("מחשב מסלול..."):
+                    plan = plan_route(st.session_state["temp_route_list"], get_geocoder(),
+                                      start_address=start_address.strip() or None)
+                st.session_state["temp_route_list"] = plan["stops"]
+                st.session_state["route_plan_info"] = plan
+                st.rerun()
+            plan_info = st.session_state.get("route_plan_info")
+            if plan_info:
+                st.caption(f"אורך מסלול משוער: {plan_info['distance_km']} ק\"מ")
+                if plan_info["unresolved"]:
+                    st.warning("⚠️ כתובות שלא נמצאו (נשארו בסוף המסלול): " + ", ".join(map(str, plan_info["unresolved"])))
+        
         col_actions1, col_actions2 = st.columns(2)
         
         with col_actions1:
             if st.button("🗑️ נקה רשימה והתחל מחדש"):
                 st.session_state["temp_route_list"] = []
+                st.session_state.pop("route_plan_info", None)
+                st.session_state.pop("import_result", None)
                 st.rerun()
                 
         with col_actions2:
@@ -136,17 +324,25 @@ if page == "בניית מסלול (הזנה)":
                     }
                     
                     progress = st.progress(0)
-                    sent_count = 0
-                    total = len(st.session_state["temp_route_list"])
+                    outgoing = []
+                    
+                    # חישוב זמנים משוערים לכל המסלול בבת אחת, מאותה שעת יציאה.
+                    # אחרי סידור אוטומטי - לפי זמן הנסיעה בפועל בין העצירות
+                    route_items = st.session_state["temp_route_list"]
+                    if all("leg_minutes" in item for item in route_items):
+                        time_ranges = compute_route_windows(
+                            len(route_items), service_minutes=[item["leg_minutes"] for item in route_items])
+                    else:
+                        time_ranges = compute_route_windows(len(route_items))
                     
                     for i, item in enumerate(st.session_state["temp_route_list"]):
-                        # חישוב זמן משוער
-                        time_range = calculate_time_range(i + 1)
+                        time_range = time_ranges[i]
                         
                         delivery = {
                             "sequence_number": item["seq"],
                             "recipient_name": item["name"],
                             "recipient_phone": item["phone"],
+                            "address": item.get("address") or None,
                             "status": "נשלח",
                             "last_message": "",
                             "someone_home": None,
@@ -169,16 +365,41 @@ if page == "בניית מסלול (הזנה)":
 כדי שאוכל למסור אותו, אני צריך לדעת:
 ❓ האם יהיה מישהו בבית בשעות אלו? (כן / לא)"""
 
-                        send_whatsapp_message(item["phone"], msg)
-                        sent_count += 1
-                        progress.progress((i + 1) / total)
+                        outgoing.append((item["phone"], msg))
                     
-                    # שמירה ל-DB
-                    st.session_state["all_batches"][batch_id] = new_batch
-                    save_data(st.session_state["all_batches"])
+                    # שמירה ל-DB לפני השליחה, כדי שתשובה מהירה של לקוח כבר תמצא את המשלוח
+                    store.save_batch(batch_id, new_batch)
+                    
+                    # שליחה מקבילית עם הגבלת קצב וניסיונות חוזרים
+                    results = send_whatsapp_bulk(
+                        outgoing,
+                        progress_callback=lambda done, total: progress.progress(done / total)
+                    )
+                    
+                    # סימון משלוחים שההודעה אליהם לא נשלחה. קוראים מה-DB ומעדכנים אופטימית (כמו ב-webhook):
+                    # אם ההודעה בכל זאת הגיעה (timeout ואז ניסיון חוזר) והלקוח כבר ענה, לא דורסים את מה שנאסף
+                    failed = []
+                    for idx, (delivery, result) in enumerate(zip(new_batch["deliveries"], results)):
+                        if result["ok"]:
+                            continue
+                        failed.append(delivery)
+                        while True:
+                            current = store.get_delivery(batch_id, idx)
+                            if current is None or current.get("status") != "נשלח":
+                                break
+                            current["status"] = "שגיאת שליחה"
+                            current["send_error"] = result["error"]
+                            if store.update_delivery(batch_id, idx, current, expected_version=current["version"]):
+                                break
+                    sent_count = len(results) - len(failed)
                     
                     # איפוס
                     st.session_state["temp_route_list"] = []
+                    st.session_state.pop("route_plan_info", None)
+                    st.session_state.pop("import_result", None)
+                    if failed:
+                        st.warning("⚠️ לא הצלחנו לשלוח ל: " + ", ".join(
+                            f"{d['recipient_name']} ({d['recipient_phone']})" for d in failed))
                     st.success(f"✅ המסלול נוצר בהצלחה! נשלחו {sent_count} הודעות.")
                     st.balloons()
 
@@ -192,51 +413,61 @@ elif page == "המסלול שלי (צפייה)":
     default_phone = st.session_state.get("dispatcher_phone", "")
     search = st.text_input("הכנס טלפון שליח:", value=default_phone, placeholder="05X-XXXXXXX").strip()
     
+    c1, c2 = st.columns(2)
+    with c1:
+        active_only = st.checkbox("רק מסלולים פעילים", value=True)
+    with c2:
+        use_dates = st.checkbox("סינון לפי תאריכים")
+    date_from = date_to = None
+    if use_dates:
+        date_range = st.date_input("טווח תאריכים", value=(date.today() - timedelta(days=7), date.today()))
+        if isinstance(date_range, (tuple, list)) and len(date_range) == 2:
+            date_from, date_to = (d.strftime("%Y%m%d") for d in date_range)
+    
     if search:
         norm_search = normalize_phone(search)
         
-        # שימוש ב-session_state כדי למנוע טעינה מחדש מיותרת
-        all_data = st.session_state["all_batches"]
-        my_deliveries = []
+        # הטבלה מתרעננת לבד (רק מה שהשתנה) כל VIEW_REFRESH_SECONDS שניות
+        render_dispatcher_table(norm_search, active_only, date_from, date_to)
         
-        # איסוף כל המשלוחים (עם הגנה מפני סוגי מידע שגויים)
-        if isinstance(all_data, dict):
-            for bid, bdata in all_data.items():
-                if bdata.get("dispatcher_phone") == norm_search:
-                    my_deliveries.extend(bdata["deliveries"])
+        st.info("💡 הנתונים מתעדכנים בזמן אמת כשהלקוחות עונים בוואטסאפ.")
         
-        if not my_deliveries:
-            st.warning("לא נמצאו משלוחים למספר זה.")
-        else:
-            # המרה ל-DF ומיון
-            df = pd.DataFrame(my_deliveries)
-            
-            # מיון לפי ה-Batch ID (שהוא זמן) ואז לפי המספר הסידורי
-            df = df.sort_values(by=["batch_id", "sequence_number"], ascending=[False, True])
-            
-            st.subheader(f"סה״כ משלוחים פעילים: {len(df)}")
-
-            # תצוגה נקייה לשליח
-            df_show = df[[
-                "sequence_number", "recipient_name", "recipient_phone", "someone_home", 
-                "drop_location", "floor", "apartment", "entrance_code", "status"
-            ]].rename(columns={
-                "sequence_number": "מס'",
-                "recipient_name": "שם",
-                "recipient_phone": "טלפון",
-                "someone_home": "בבית?",
-                "drop_location": "איפה להשאיר",
-                "floor": "קומה",
-                "apartment": "דירה",
-                "entrance_code": "קוד",
-                "status": "סטטוס"
-            })
-            
-            # שימוש ב-dataframe אינטראקטיבי
-            st.dataframe(df_show, hide_index=True)
-            
-            st.info("💡 הנתונים מתעדכנים בזמן אמת כשהלקוחות עונים בוואטסאפ.")
-            
-            if st.button("🔄 רענן נתונים"):
-                st.session_state["all_batches"] = load_data()
-                st.rerun()
\ No newline at end of file
+        if st.button("🔄 רענן נתונים"):
+            load_dispatcher_view.clear()
+            st.session_state.pop("dispatcher_view", None)
+            st.rerun()
+        
+        # --- סימון משלוח שנמסר: חלונות הזמן של שאר העצירות במסלול מחושבים מחדש מעכשיו ---
+        with st.expander("✅ סימון משלוח כנמסר"):
+            pending = [(b, i, d) for b, i, d in store.query_dispatcher_deliveries(norm_search, active_only=True)
+                       if d.get("status") != store.DELIVERED_STATUS]
+            if pending:
+                choice = st.selectbox(
+                    "משלוח:", range(len(pending)),
+                    format_func=lambda k: f"{pending[k][2].get('sequence_number')}. {pending[k][2].get('recipient_name')} "
+                                          f"({pending[k][2].get('recipient_phone')}) - {pending[k][0]}")
+                if st.button("✅ נמסר"):
+                    batch_id, idx, _ = pending[choice]
+                    store.update_delivery_fields(batch_id, {idx: {"status": store.DELIVERED_STATUS}})
+                    batch = store.get_batch(batch_id)
+                    windows = recompute_remaining_windows(batch["deliveries"]) if batch else {}
+                    store.update_delivery_fields(
+                        batch_id, {i: {"estimated_time_range": w} for i, w in windows.items()})
+                    st.success(f"✅ סומן כנמסר. עודכנו חלונות הזמן של {len(windows)} עצירות שנותרו במסלול.")
+            else:
+                st.info("אין משלוחים פתוחים.")
+    
+    # --- מסלולים ישנים שעברו לארכיון ---
+    with st.expander("🗄️ חיפוש בארכיון לפי טלפון לקוח"):
+        archive_phone = st.text_input("טלפון לקוח:", key="archive_phone").strip()
+        if archive_phone:
+            found = find_archived_deliveries(archive_phone)
+            if found:
+                st.dataframe(pd.DataFrame([
+                    {"מסלול": b, "שם": d.get("recipient_name"), "סטטוס": d.get("status"),
+                     "מיקום": d.get("drop_location"), "דירה": d.get("apartment"), "קומה": d.get("floor"),
+                     "הודעה אחרונה": d.get("last_message")}
+                    for b, i, d in found
+                ]), use_container_width=True, hide_index=True)
+            else:
+                st.info("לא נמצאו משלוחים בארכיון למספר הזה.")
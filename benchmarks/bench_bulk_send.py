@@ -0,0 +1,80 @@
+"""
+בנצ'מרק: שליחת הודעות פתיחה למסלול - שליחה סדרתית (הקוד הישן ב-app.py) מול send_whatsapp_bulk.
+
+השליחה היא לשרת stub מקומי שמדמה את sendMessage של Green API, עם השהיה ואחוז שגיאות שניתנים להגדרה.
+הרצה מתיקיית הפרויקט:
+    python benchmarks/bench_bulk_send.py [--stops 60] [--latency 0.2] [--error-rate 0.05] [--rate 20]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import services
+
+
+def make_stub(latency: float, error_rate: float):
+    class GreenStub(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            time.sleep(latency)
+            if random.random() < error_rate:
+                status, body = 500, b'{"error":"stub failure"}'
+            else:
+                status, body = 200, json.dumps({"idMessage": f"{random.getrandbits(64):X}"}).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), GreenStub)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stops", type=int, default=60)
+    parser.add_argument("--latency", type=float, default=0.2, help="השהיית השרת בשניות")
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--rate", type=float, default=20, help="הודעות לשנייה (token bucket)")
+    parser.add_argument("--workers", type=int, default=8)
+    args = parser.parse_args()
+
+    server = make_stub(args.latency, args.error_rate)
+    services.GREEN_API_URL = f"http://127.0.0.1:{server.server_address[1]}"
+    messages = [(f"05{i:08d}", f"היי! משלוח מספר {i}") for i in range(args.stops)]
+
+    t0 = time.perf_counter()
+    serial_ok = sum(services.send_whatsapp_message(p, m) for p, m in messages)
+    serial_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    results = services.send_whatsapp_bulk(messages, rate_per_second=args.rate, burst=args.workers,
+                                          max_workers=args.workers, backoff=0.1)
+    bulk_s = time.perf_counter() - t0
+    bulk_ok = sum(r["ok"] for r in results)
+    retried = sum(r["attempts"] > 1 for r in results)
+
+    server.shutdown()
+    print(f"stops={args.stops} latency={args.latency}s error_rate={args.error_rate:.0%}")
+    print(f"serial : {serial_s:6.2f}s  delivered {serial_ok}/{args.stops}")
+    print(f"bulk   : {bulk_s:6.2f}s  delivered {bulk_ok}/{args.stops}  (retried {retried}, "
+          f"rate {args.rate}/s, {args.workers} workers)")
+
+
+if __name__ == "__main__":
+    main()
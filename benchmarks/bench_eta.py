@@ -0,0 +1,62 @@
+"""
+בנצ'מרק לחישוב חלונות ההגעה: הלולאה הישנה (strftime + timedelta לכל עצירה, datetime.now() בכל קריאה)
+מול eta.compute_route_windows שמחשב את כל המסלול במעבר אחד. בודק גם שהתוצאות זהות.
+הרצה מתיקיית הפרויקט:
+    python benchmarks/bench_eta.py --stops 10000 --routes 20
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from eta import compute_route_windows, recompute_remaining_windows
+
+
+def legacy_time_range(position: int, start_time: datetime = None) -> str:
+    # המימוש הקודם של services.calculate_time_range, להשוואה
+    if start_time is None:
+        start_time = datetime.now()
+    start_delay = 30 + (position * 5)
+    end_delay = start_delay + 120
+    arrival_min = start_time + timedelta(minutes=start_delay)
+    arrival_max = start_time + timedelta(minutes=end_delay)
+    return f"{arrival_min.strftime('%H:%M')}-{arrival_max.strftime('%H:%M')}"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stops", type=int, default=10_000)
+    parser.add_argument("--routes", type=int, default=20)
+    args = parser.parse_args()
+
+    start = datetime(2024, 5, 1, 22, 47, 31)
+    expected = [legacy_time_range(i + 1, start) for i in range(args.stops)]
+    assert compute_route_windows(args.stops, start) == expected, "vectorized windows differ from legacy"
+
+    t0 = time.perf_counter()
+    for _ in range(args.routes):
+        [legacy_time_range(i + 1) for i in range(args.stops)]
+    legacy = (time.perf_counter() - t0) / args.routes
+
+    t0 = time.perf_counter()
+    for _ in range(args.routes):
+        compute_route_windows(args.stops)
+    vectorized = (time.perf_counter() - t0) / args.routes
+
+    deliveries = [{"sequence_number": i + 1, "status": "נמסר" if i % 3 == 0 else "נשלח"} for i in range(args.stops)]
+    t0 = time.perf_counter()
+    for _ in range(args.routes):
+        recompute_remaining_windows(deliveries)
+    recompute = (time.perf_counter() - t0) / args.routes
+
+    print(f"stops per route:     {args.stops}")
+    print(f"legacy loop:         {legacy * 1000:.2f} ms/route")
+    print(f"compute_route_windows: {vectorized * 1000:.2f} ms/route  (x{legacy / vectorized:.1f})")
+    print(f"recompute remaining: {recompute * 1000:.2f} ms/route")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""
+בנצ'מרק למסלול המהיר (fast_parser): אחוז ההודעות שנענות בלי AI, דיוק החילוץ וזמן הריצה.
+
+הקורפוס הוא הודעות לקוח לדוגמה יחד עם המצב בזמן שנשלחו. expected=None אומר שההודעה
+צריכה ללכת ל-AI (למשל שאלה חופשית), ואז "פגיעה" נחשבת טעות.
+הרצה מתיקיית הפרויקט:
+    python benchmarks/bench_fast_parser.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fast_parser import fast_parse
+
+EMPTY = {"someone_home": None, "drop_location": None, "apartment": None, "floor": None, "entrance_code": None}
+NOT_HOME = {**EMPTY, "someone_home": "no"}
+AT_DOOR = {**NOT_HOME, "drop_location": "ליד הדלת"}
+
+CORPUS = [
+    ("כן", EMPTY, {"someone_home": "yes"}),
+    ("כן!", EMPTY, {"someone_home": "yes"}),
+    ("כן יהיה מישהו", EMPTY, {"someone_home": "yes"}),
+    ("בטח", EMPTY, {"someone_home": "yes"}),
+    ("אני בבית", EMPTY, {"someone_home": "yes"}),
+    ("yes", EMPTY, {"someone_home": "yes"}),
+    ("לא", EMPTY, {"someone_home": "no"}),
+    ("לא.", EMPTY, {"someone_home": "no"}),
+    ("לא יהיה אף אחד", EMPTY, {"someone_home": "no"}),
+    ("אני לא בבית", EMPTY, {"someone_home": "no"}),
+    ("תשאיר בלובי", EMPTY, {"drop_location": "לובי", "someone_home": "no"}),
+    ("תשאיר בלובי בבקשה", NOT_HOME, {"drop_location": "לובי"}),
+    ("בלובי", NOT_HOME, {"drop_location": "לובי"}),
+    ("לשומר", NOT_HOME, {"drop_location": "שומר"}),
+    ("אצל השומר תודה", NOT_HOME, {"drop_location": "שומר"}),
+    ("אפשר להשאיר בקבלה", NOT_HOME, {"drop_location": "קבלה"}),
+    ("לא בבית, תשאיר בקבלה", EMPTY, {"drop_location": "קבלה", "someone_home": "no"}),
+    ("אין אף אחד, תשאיר בלובי", EMPTY, {"drop_location": "לובי", "someone_home": "no"}),
+    ("אף אחד לא יהיה, תשאיר לשומר", EMPTY, {"drop_location": "שומר", "someone_home": "no"}),
+    ("ליד הדלת", NOT_HOME, {"drop_location": "ליד הדלת"}),
+    ("תשאיר ליד הדלת", NOT_HOME, {"drop_location": "ליד הדלת"}),
+    ("קומה 2 דירה 4", AT_DOOR, {"floor": "2", "apartment": "4"}),
+    ("קומה 3", AT_DOOR, {"floor": "3"}),
+    ("דירה 12", {**AT_DOOR, "floor": "3"}, {"apartment": "12"}),
+    ("קוד 1234", {**AT_DOOR, "floor": "3", "apartment": "12"}, {"entrance_code": "1234"}),
+    ("קוד כניסה 4590#", {**AT_DOOR, "floor": "3", "apartment": "12"}, {"entrance_code": "4590#"}),
+    ("דירה 7, קומה 1, קוד 2580", AT_DOOR, {"floor": "1", "apartment": "7", "entrance_code": "2580"}),
+    ("ק' 5 ד' 18", AT_DOOR, {"floor": "5", "apartment": "18"}),
+    ("הקוד הוא 1379", {**AT_DOOR, "floor": "3", "apartment": "12"}, {"entrance_code": "1379"}),
+    # הודעות שצריכות ללכת ל-AI
+    ("כן", {**EMPTY, "someone_home": "no"}, None),
+    # כן/לא אחרי שכבר נאספו פרטים - אולי תשובה לשאלה על הקוד ולא על הבית
+    ("כן", {**EMPTY, "floor": "3"}, None),
+    ("לא", {**EMPTY, "floor": "3"}, None),
+    ("כן", {**EMPTY, "floor": "3", "apartment": "4"}, None),
+    ("לא", {**EMPTY, "floor": "3", "apartment": "4"}, None),
+    # שלילה של המקום - ההפך ממה שהמסלול המהיר היה מבין
+    ("לא בלובי", EMPTY, None),
+    ("לא לשומר", EMPTY, None),
+    ("לא שומר", NOT_HOME, None),
+    ("אף אחד לא בלובי", EMPTY, None),
+    ("לא ליד הדלת", NOT_HOME, None),
+    ("אל תשאיר בלובי", NOT_HOME, None),
+    # אישור שקראו את ההודעה, לא תשובה לשאלה
+    ("אוקי", EMPTY, None),
+    ("סבבה", EMPTY, None),
+    ("אולי, תלוי מתי בדיוק תגיע", EMPTY, None),
+    ("מה זה המשלוח הזה?", EMPTY, None),
+    ("אני אהיה רק אחרי 5", EMPTY, None),
+    ("תתקשר כשאתה מגיע", EMPTY, None),
+    ("תשאיר אצל השכנה בדירה 3", NOT_HOME, None),
+    ("הקומה השלישית", AT_DOOR, None),
+    ("אין קוד, הדלת פתוחה", {**AT_DOOR, "floor": "3", "apartment": "12"}, None),
+    ("אפשר לשנות כתובת?", EMPTY, None),
+    ("שלום", EMPTY, None),
+    ("תודה", EMPTY, None),
+    ("מי זה?", EMPTY, None),
+    ("אני בעבודה עד 6, בעלי בבית", EMPTY, None),
+]
+
+ROUNDS = 2000
+
+
+def main():
+    hits = correct = false_hits = 0
+    expected_hits = sum(expected is not None for _, _, expected in CORPUS)
+    for text, state, expected in CORPUS:
+        result = fast_parse(text, state)
+        if result is None:
+            if expected is not None:
+                print(f"  miss       : {text!r}")
+            continue
+        hits += 1
+        if expected is None:
+            false_hits += 1
+            print(f"  false hit  : {text!r} -> {result['extracted_data']}")
+        elif result["extracted_data"] == expected:
+            correct += 1
+        else:
+            print(f"  wrong      : {text!r} -> {result['extracted_data']} (expected {expected})")
+
+    t0 = time.perf_counter()
+    for _ in range(ROUNDS):
+        for text, state, _ in CORPUS:
+            fast_parse(text, state)
+    per_msg_us = (time.perf_counter() - t0) / (ROUNDS * len(CORPUS)) * 1e6
+
+    print(f"messages            : {len(CORPUS)}")
+    print(f"fast-path hit rate  : {hits / len(CORPUS):.0%} ({hits}/{len(CORPUS)}; "
+          f"{expected_hits} expected)")
+    print(f"correct extractions : {correct}/{hits}, false hits: {false_hits}")
+    print(f"latency per message : {per_msg_us:.1f} µs (vs. hundreds of ms for an LLM round trip)")
+
+
+if __name__ == "__main__":
+    main()
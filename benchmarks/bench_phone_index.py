@@ -0,0 +1,101 @@
+"""
+בנצ'מרק: זמן חיפוש משלוח לפי טלפון נמען ב-1k / 100k / 1M משלוחים שמורים.
+
+משווה את האינדקס ב-store (find_active_delivery) לסריקה הלינארית הישנה של find_and_update_delivery.
+הרצה מתיקיית הפרויקט:
+    python benchmarks/bench_phone_index.py [--sizes 1000,100000,1000000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import store
+from services import normalize_phone
+
+STOPS_PER_ROUTE = 50
+LOOKUPS = 2000
+LEGACY_SCAN_LIMIT = 100_000  # מעל זה הסריקה הישנה איטית מדי (ואוכלת זיכרון) ולא נמדדת
+
+
+def make_phone(i: int) -> str:
+    return f"9725{i:08d}"
+
+
+def iter_batches(total: int):
+    routes = (total + STOPS_PER_ROUTE - 1) // STOPS_PER_ROUTE
+    n = 0
+    for r in range(routes):
+        batch_id = f"ROUTE-2025{r // 86400 % 12 + 1:02d}01-{r % 86400:06d}"
+        deliveries = []
+        for j in range(min(STOPS_PER_ROUTE, total - n)):
+            deliveries.append({
+                "sequence_number": j + 1,
+                "recipient_name": "לקוח",
+                "recipient_phone": make_phone(n),
+                "status": "מלא" if random.random() < 0.9 else "נשלח",
+                "batch_id": batch_id,
+            })
+            n += 1
+        yield batch_id, {"dispatcher_phone": "972500000000", "upload_time": "2025-01-01 08:00",
+                         "deliveries": deliveries}
+
+
+def legacy_find(all_batches, phone):
+    # העתק של המימוש הקודם ב-webhook_server (סריקה לינארית + נרמול בכל השוואה)
+    norm_phone = phone.lstrip("972")
+    for bid, bdata in all_batches.items():
+        for i, d in enumerate(bdata["deliveries"]):
+            if normalize_phone(str(d.get("recipient_phone"))).lstrip("972") == norm_phone:
+                return d, bid, str(i)
+    return None, None, None
+
+
+def bench(size: int):
+    tmp = tempfile.mkdtemp()
+    store.DB_FILE = os.path.join(tmp, "bench.db")
+    store.AUTO_MIGRATE = False
+
+    t0 = time.perf_counter()
+    with store._transaction() as conn:
+        for batch_id, batch in iter_batches(size):
+            store._write_batch(conn, batch_id, batch)
+    load_s = time.perf_counter() - t0
+
+    phones = [make_phone(random.randrange(size)) for _ in range(LOOKUPS)]
+    t0 = time.perf_counter()
+    for p in phones:
+        assert store.find_active_delivery(p) is not None
+    indexed_us = (time.perf_counter() - t0) / LOOKUPS * 1e6
+
+    legacy_us = None
+    if size <= LEGACY_SCAN_LIMIT:
+        all_batches = dict(iter_batches(size))
+        sample = phones[:20]
+        t0 = time.perf_counter()
+        for p in sample:
+            legacy_find(all_batches, p)
+        legacy_us = (time.perf_counter() - t0) / len(sample) * 1e6
+
+    store.close()
+    legacy = f"{legacy_us:>12,.0f}" if legacy_us is not None else f"{'-':>12}"
+    print(f"{size:>10,} | {load_s:>8.1f}s | {indexed_us:>10.1f} | {legacy}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,100000,1000000")
+    args = parser.parse_args()
+
+    random.seed(1)
+    print(f"{'deliveries':>10} | {'insert':>9} | {'index µs':>10} | {'legacy µs':>12}")
+    for size in (int(s) for s in args.sizes.split(",")):
+        bench(size)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""
+מיקרו-בנצ'מרק לנרמול טלפונים ולבדיקת המספרים המורשים:
+- normalize_phone הישן מול phones.normalize_phone (קאש קר / חם), ועל רשימה של מספרים שונים מול normalize_phones
+- בדיקת שייכות: טעינת allowed_numbers.json ובדיקה ברשימה מול phones.Allowlist (frozenset)
+הרצה מתיקיית הפרויקט:
+    python benchmarks/bench_phones.py --count 100000
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import phones
+
+
+def legacy_normalize_phone(phone: str) -> str:
+    # המימוש הקודם מ-services.py, להשוואה
+    phone = str(phone).strip().replace("-", "").replace(" ", "").replace("+", "")
+    phone = phone.lstrip("0")
+    if not phone.startswith("972"):
+        phone = "972" + phone
+    return phone
+
+
+def timed(label: str, fn, count: int):
+    t0 = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - t0
+    print(f"{label:<34} {elapsed * 1e9 / count:8.0f} ns/phone")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=100_000)
+    parser.add_argument("--distinct", type=int, default=2_000, help="כמה טלפונים שונים (הודעות חוזרות מאותם לקוחות)")
+    args = parser.parse_args()
+
+    rnd = random.Random(1)
+    formats = ["05{}-{:07d}", "05{}{:07d}", "+972 5{}-{:07d}", "9725{}{:07d}"]
+    distinct = [rnd.choice(formats).format(rnd.randint(0, 9), rnd.randint(0, 9_999_999)) for _ in range(args.distinct)]
+    stream = [rnd.choice(distinct) for _ in range(args.count)]
+    assert [phones.normalize_phone(p) for p in distinct] == [legacy_normalize_phone(p) for p in distinct]
+
+    print(f"{args.count} phones, {args.distinct} distinct")
+    timed("legacy normalize_phone", lambda: [legacy_normalize_phone(p) for p in stream], args.count)
+    phones._normalize.cache_clear()
+    timed("phones.normalize_phone (cold)", lambda: [phones.normalize_phone(p) for p in distinct], args.distinct)
+    timed("phones.normalize_phone (warm)", lambda: [phones.normalize_phone(p) for p in stream], args.count)
+    unique = [f"05{i % 10}-{i:07d}" for i in range(args.count)]
+    timed("legacy loop, all unique", lambda: [legacy_normalize_phone(p) for p in unique], args.count)
+    timed("phones.normalize_phones (list)", lambda: phones.normalize_phones(unique), args.count)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "allowed_numbers.json")
+        allowed = [p.lstrip("0").replace("-", "") for p in rnd.sample(unique, 1000)]
+        with open(path, "w", encoding="utf8") as f:
+            json.dump(allowed, f)
+        lookups = stream[:10_000]
+
+        def legacy_allowed():
+            for p in lookups:
+                with open(path, "r", encoding="utf8") as f:
+                    numbers = json.load(f)
+                legacy_normalize_phone(p) in [legacy_normalize_phone(n) for n in numbers]
+
+        allowlist = phones.Allowlist(path)
+        timed("legacy load + list membership", legacy_allowed, len(lookups))
+        timed("Allowlist membership", lambda: [p in allowlist for p in lookups], len(lookups))
+
+        # טעינה מחדש כשהקובץ משתנה
+        allowlist = phones.Allowlist(path, check_seconds=0)
+        new_phone = "0509999999"
+        assert new_phone not in allowlist
+        with open(path, "w", encoding="utf8") as f:
+            json.dump(allowed + [new_phone], f)
+        os.utime(path, (time.time() + 5, time.time() + 5))
+        assert new_phone in allowlist, "allowlist did not reload"
+        print("hot reload: ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+בנצ'מרק ל-retention: DB עם היסטוריה של כמה שבועות, לפני ואחרי העברת המסלולים הסגורים לארכיון -
+גודל ה-DB, זמן שאילתת מסך השליח, זמן הארכוב עצמו וחיפוש בארכיון לפי טלפון.
+בודק גם שכל משלוח שיצא מה-DB נמצא בארכיון.
+הרצה מתיקיית הפרויקט:
+    python benchmarks/bench_retention.py --days 30 --routes-per-day 20 --stops 100
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import retention
+import store
+
+DISPATCHERS = [f"97250{i:07d}" for i in range(10)]
+
+
+def seed(days: int, routes_per_day: int, stops: int, now: datetime):
+    rnd = random.Random(1)
+    n = 0
+    for day in range(days, -1, -1):
+        for r in range(routes_per_day):
+            created = now - timedelta(days=day, minutes=r * 10)
+            batch_id = f"ROUTE-{created:%Y%m%d-%H%M%S}"
+            # מסלולים ישנים כמעט תמיד נסגרו; של היום רובם עוד פתוחים
+            done_share = 0.98 if day > 1 else 0.3
+            deliveries = []
+            for i in range(stops):
+                n += 1
+                done = rnd.random() < done_share
+                deliveries.append({"sequence_number": i + 1, "recipient_name": "לקוח",
+                                   "recipient_phone": f"97252{n % 50_000:07d}", "status": "מלא" if done else "נשלח",
+                                   "someone_home": "yes" if done else None, "batch_id": batch_id})
+            # רוב המסלולים הישנים סגורים לגמרי
+            if day > 1 and r % 10:
+                for d in deliveries:
+                    d["status"] = "מלא"
+            store.save_batch(batch_id, {"dispatcher_phone": DISPATCHERS[r % len(DISPATCHERS)],
+                                        "upload_time": f"{created:%Y-%m-%d %H:%M}", "deliveries": deliveries})
+
+
+def db_size() -> int:
+    return sum(os.path.getsize(store.DB_FILE + s) for s in ("", "-wal") if os.path.exists(store.DB_FILE + s))
+
+
+def dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, f)) for root, _, files in os.walk(path) for f in files)
+
+
+def time_queries(label: str):
+    t0 = time.perf_counter()
+    for phone in DISPATCHERS:
+        store.query_dispatcher_deliveries(phone, active_only=False)
+    view = (time.perf_counter() - t0) / len(DISPATCHERS)
+    counts = store._connect().execute("SELECT (SELECT COUNT(*) FROM batches), (SELECT COUNT(*) FROM deliveries)").fetchone()
+    print(f"{label:<8} batches {counts[0]:6,}  deliveries {counts[1]:8,}  db {db_size() / 1e6:7.1f} MB  "
+          f"dispatcher view (all routes) {view * 1000:7.1f} ms")
+    return counts[1]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--routes-per-day", type=int, default=20)
+    parser.add_argument("--stops", type=int, default=100)
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    store.DB_FILE = os.path.join(tmp, "retention.db")
+    store.AUTO_MIGRATE = False
+    archive_dir = os.path.join(tmp, "archive")
+    now = datetime.now()
+
+    seed(args.days, args.routes_per_day, args.stops, now)
+    before = time_queries("before")
+
+    t0 = time.perf_counter()
+    result = retention.run_retention(now=now, vacuum=True, archive_dir=archive_dir)
+    elapsed = time.perf_counter() - t0
+    after = time_queries("after")
+    print(f"archived {result['archived']} routes / {result['deliveries']:,} deliveries in {elapsed:.2f}s  "
+          f"archive {dir_size(archive_dir) / 1e6:.1f} MB in {len(retention.archived_days(archive_dir))} daily files")
+    assert before - after == result["deliveries"], "deliveries missing after archiving"
+
+    phones = [f"97252{random.randrange(50_000):07d}" for _ in range(50)]
+    t0 = time.perf_counter()
+    found = sum(len(retention.find_archived_deliveries(p, archive_dir)) for p in phones)
+    lookup = (time.perf_counter() - t0) / len(phones)
+    print(f"archive lookup by phone: {lookup * 1000:.1f} ms ({found / len(phones):.1f} deliveries per phone)")
+
+    archived_total = sum(1 for _ in retention.iter_archive("00000000", "99999999", archive_dir=archive_dir))
+    assert archived_total == result["deliveries"], "archive does not hold every archived delivery"
+    print("archive round-trip: ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+"""
+בנצ'מרק לייבוא מניפסט: קובץ CSV של 10k שורות (עם שורות כפולות ושגויות) דרך route_import.import_route_file,
+מול הדרך הישנה - normalize_phone שורה-שורה ובדיקת כפילות ברשימה.
+הרצה מתיקיית הפרויקט:
+    python benchmarks/bench_route_import.py --rows 10000
+"""
+import argparse
+import csv
+import io
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from phones import normalize_phones
+from route_import import import_route_file
+from services import normalize_phone
+
+
+def make_manifest(rows: int, seed: int) -> bytes:
+    rnd = random.Random(seed)
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["מס'", "שם", "טלפון", "כתובת"])
+    phones = []
+    for i in range(rows):
+        r = rnd.random()
+        if r < 0.02 and phones:
+            phone = rnd.choice(phones)  # כפילות
+        elif r < 0.03:
+            phone = "05-12"  # קצר מדי
+        else:
+            phone = f"05{rnd.randint(0, 9)}-{rnd.randint(0, 9999999):07d}"
+            phones.append(phone)
+        writer.writerow([i + 1, f"לקוח {i}", phone, f"הרצל {rnd.randint(1, 200)}, תל אביב"])
+    return out.getvalue().encode("utf-8-sig")
+
+
+def legacy_import(data: bytes):
+    items, seen = [], []
+    for row in csv.DictReader(io.StringIO(data.decode("utf-8-sig"))):
+        phone = normalize_phone(row["טלפון"])
+        if phone in [item["phone"] for item in items]:  # כמו בדיקה ידנית מול הרשימה
+            continue
+        items.append({"seq": int(row["מס'"]), "name": row["שם"], "phone": phone, "address": row["כתובת"]})
+    return items
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    data = make_manifest(args.rows, args.seed)
+
+    sample = [f"05{i % 10}-{i:07d}" for i in range(1000)] + ["+972 50 1234567", "0501234567", "972501234567"]
+    assert normalize_phones(sample).tolist() == [normalize_phone(p) for p in sample], "bulk rules differ"
+
+    t0 = time.perf_counter()
+    result = import_route_file(data, "manifest.csv")
+    new = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    legacy_items = legacy_import(data)
+    legacy = time.perf_counter() - t0
+
+    print(f"rows:            {args.rows}  ({len(data) / 1024:.0f} KiB)")
+    print(f"imported:        {len(result['items'])}  row errors: {len(result['errors'])}")
+    print(f"import_route_file: {new * 1000:.1f} ms")
+    print(f"legacy row loop:   {legacy * 1000:.1f} ms  ({len(legacy_items)} rows, no validation)")
+
+
+if __name__ == "__main__":
+    main()
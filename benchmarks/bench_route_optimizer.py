@@ -0,0 +1,72 @@
+"""
+בנצ'מרק לסידור המסלול: זמן הפתרון ואורך המסלול (ק"מ) מול הסדר המקורי ומול nearest-neighbour לבד.
+הנקודות אקראיות באזור גוש דן ועוברות דרך CachedGeocoder עם ספק מקומי - בלי רשת.
+הרצה מתיקיית הפרויקט:
+    python benchmarks/bench_route_optimizer.py --stops 100 --runs 10
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from route_optimizer import CachedGeocoder, distance_matrix, plan_route, _nearest_neighbour
+
+
+class DictGeocoder:
+    def __init__(self, points):
+        self.points = points
+        self.calls = 0
+
+    def geocode(self, address):
+        self.calls += 1
+        return self.points.get(address)
+
+
+def route_length(coords):
+    coords = np.asarray(coords)
+    return float(np.sum(distance_matrix(coords)[np.arange(len(coords) - 1), np.arange(1, len(coords))]))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stops", type=int, default=100)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    rnd = random.Random(args.seed)
+    worst = 0.0
+    for run in range(args.runs):
+        points = {f"רחוב {run}-{i}": (32.0 + rnd.random() * 0.15, 34.75 + rnd.random() * 0.1)
+                  for i in range(args.stops)}
+        stops = [{"seq": i + 1, "name": "לקוח", "phone": "9725000000", "address": a}
+                 for i, a in enumerate(points)]
+        provider = DictGeocoder(points)
+        geocoder = CachedGeocoder(provider, path="")
+
+        t0 = time.perf_counter()
+        plan = plan_route(stops, geocoder)
+        elapsed = time.perf_counter() - t0
+        worst = max(worst, elapsed)
+
+        # ריצה שנייה - הכל מהקאש
+        calls = provider.calls
+        plan_route(stops, geocoder)
+        assert provider.calls == calls, "second run should be served from the cache"
+
+        coords = list(points.values())
+        manual = route_length(coords)
+        nn = route_length(np.asarray(coords)[_nearest_neighbour(distance_matrix(np.asarray(coords)), 0)])
+        print(f"run {run}: {elapsed * 1000:7.1f} ms  manual {manual:6.1f} km  "
+              f"nn {nn:6.1f} km  nn+2opt {plan['distance_km']:6.1f} km")
+
+    print(f"worst solve time for {args.stops} stops: {worst * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
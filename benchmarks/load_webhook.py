@@ -0,0 +1,224 @@
+"""
+מחולל עומס ל-webhook_server ולשליחה ההמונית של app.py, מול שרתי הדמה של benchmarks/stub_servers.py
+(בלי קריאות ל-Green API או ל-OpenAI האמיתיים).
+
+מצב webhook (ברירת מחדל): שולח webhooks במבנה של Green API (messageData / senderData) בקצב קבוע
+(open loop - לא מחכה לתשובה לפני ההודעה הבאה), ומודד:
+- ack: זמן התגובה של POST /webhook
+- e2e: מהשליחה ועד שתשובת ה-WhatsApp ללקוח הגיעה לשרת הדמה של Green API
+ברירת המחדל מריצה את האפליקציה בתוך ה-process (עם ה-lifespan, התור וה-workers האמיתיים).
+עם --target שולחים לשרת שכבר רץ - אותו שרת צריך לרוץ עם GREEN_API_URL / OPENAI_BASE_URL / DB_FILE
+שהסקריפט מדפיס, ועם --green-port / --openai-port קבועים.
+
+מצב dispatch: send_whatsapp_bulk (כפתור "צור מסלול ושלח" ב-app.py) מול שרת הדמה.
+
+הרצה מתיקיית הפרויקט:
+    python benchmarks/load_webhook.py --rate 200 --duration 20 --phones 2000 --ai-share 0.3
+    python benchmarks/load_webhook.py --mode dispatch --messages 500
+"""
+import argparse
+import asyncio
+import os
+import random
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import httpx
+
+import metrics
+import services
+import store
+from stub_servers import add_stub_arguments, behaviours_from_args, start_stubs
+
+# הודעות שהמסלול המהיר מבין בלי AI
+FAST_TEXTS = ["כן", "לא", "תשאיר בלובי", "אצל השומר", "קומה 3 דירה 12 קוד 1379", "ליד הדלת בבקשה", "כן יהיה מישהו"]
+# הודעות חופשיות שהולכות ל-AI
+AI_TEXTS = [
+    "אני חוזר הביתה בערך בשש, אפשר להביא אחרי?",
+    "תתקשר כשאתה למטה, האינטרקום לא עובד",
+    "אשתי בבית עד 5, אחרי זה אף אחד",
+    "מה זה המשלוח הזה בכלל?",
+    "אפשר להשאיר אצל השכנה בדירה 4?",
+]
+
+
+def webhook_payload(phone: str, text: str) -> dict:
+    return {
+        "typeWebhook": "incomingMessageReceived",
+        "idMessage": uuid.uuid4().hex.upper(),
+        "timestamp": int(time.time()),
+        "senderData": {"chatId": f"{phone}@c.us", "sender": f"{phone}@c.us", "senderName": "לקוח"},
+        "messageData": {"typeMessage": "textMessage", "textMessageData": {"textMessage": text}},
+    }
+
+
+def seed(phones, per_route: int = 100):
+    for r in range(0, len(phones), per_route):
+        batch_id = f"ROUTE-20250101-{r // per_route:06d}"
+        store.save_batch(batch_id, {
+            "dispatcher_phone": f"97250{r // per_route:07d}",
+            "upload_time": "2025-01-01 08:00",
+            "deliveries": [{"sequence_number": i + 1, "recipient_name": "לקוח", "recipient_phone": p,
+                            "status": "נשלח", "batch_id": batch_id} for i, p in enumerate(phones[r:r + per_route])],
+        })
+
+
+def percentiles(values) -> str:
+    if not len(values):
+        return "n/a"
+    p50, p95, p99 = np.percentile(np.asarray(values) * 1000, [50, 95, 99])
+    return f"p50 {p50:8.1f} ms   p95 {p95:8.1f} ms   p99 {p99:8.1f} ms   max {max(values) * 1000:8.1f} ms"
+
+
+async def run_webhook_load(args, green_app, client: httpx.AsyncClient, drain):
+    phones = [f"97252{i:07d}" for i in range(args.phones)]
+    total = int(args.rate * args.duration)
+    rnd = random.Random(args.seed)
+    sent = defaultdict(list)  # phone -> [send time]
+    acks, statuses = [], defaultdict(int)
+
+    async def fire(phone, text):
+        started = time.perf_counter()
+        try:
+            resp = await client.post("/webhook", json=webhook_payload(phone, text))
+            status = resp.json().get("status", "?")
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        acks.append(time.perf_counter() - started)
+        statuses[status] += 1
+        if status == "queued":
+            sent[phone].append(started)
+
+    tasks = []
+    t0 = time.perf_counter()
+    for i in range(total):
+        # open loop: כל הודעה יוצאת בזמן שלה, גם אם הקודמות עוד לא נענו
+        delay = t0 + i / args.rate - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        phone = rnd.choice(phones)
+        text = rnd.choice(AI_TEXTS if rnd.random() < args.ai_share else FAST_TEXTS)
+        tasks.append(asyncio.create_task(fire(phone, text)))
+    send_elapsed = time.perf_counter() - t0
+    await asyncio.gather(*tasks)
+    await drain(sum(len(v) for v in sent.values()))
+    elapsed = time.perf_counter() - t0
+
+    # ההודעות של אותו טלפון מטופלות לפי הסדר, ולכל הודעה יוצאת תשובה אחת - מצמידים לפי הסדר
+    e2e, last_reply = [], t0
+    for phone, send_times in sent.items():
+        replies = green_app.state.received.get(phone, [])
+        for s, r in zip(send_times, replies):
+            e2e.append(r - s)
+            last_reply = max(last_reply, r)
+    replied = len(e2e)
+
+    print(f"offered rate:  {args.rate:.0f} msg/s for {args.duration:.0f}s ({total} messages, sent in {send_elapsed:.1f}s)")
+    print(f"statuses:      {dict(statuses)}")
+    print(f"ack latency:   {percentiles(acks)}")
+    print(f"e2e latency:   {percentiles(e2e)}")
+    print(f"throughput:    {replied / max(last_reply - t0, 1e-9):.1f} replies/s ({replied} replies, run {elapsed:.1f}s)")
+
+
+async def webhook_mode(args, green_app):
+    if args.target:
+        received = green_app.state.received
+
+        async def drain(expected):
+            # מחכים שכל התשובות יגיעו לשרת הדמה (או שאין התקדמות)
+            deadline = time.perf_counter() + args.drain_timeout
+            while sum(len(v) for v in received.values()) < expected and time.perf_counter() < deadline:
+                await asyncio.sleep(0.1)
+
+        limits = httpx.Limits(max_connections=args.connections)
+        async with httpx.AsyncClient(base_url=args.target, limits=limits, timeout=30) as client:
+            await run_webhook_load(args, green_app, client, drain)
+        return
+
+    import webhook_server
+
+    async def drain(expected):
+        await webhook_server.work_queue.join()
+
+    app = webhook_server.app
+    async with webhook_server.lifespan(app), \
+            httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://load") as client:
+        await run_webhook_load(args, green_app, client, drain)
+        print("queue:         ", webhook_server.work_queue.snapshot())
+
+
+def dispatch_mode(args, green_app):
+    phones = [f"97253{i:07d}" for i in range(args.messages)]
+    messages = [(p, "היי! 👋 כאן השליח של Buzz. יש לי משלוח עבורך") for p in phones]
+    done_at = []
+    t0 = time.perf_counter()
+    rate = args.send_rate or services.GREEN_RATE_PER_SECOND
+    results = services.send_whatsapp_bulk(messages, rate_per_second=rate,
+                                          progress_callback=lambda done, total: done_at.append(time.perf_counter()))
+    elapsed = time.perf_counter() - t0
+    failed = sum(1 for r in results if not r["ok"])
+    attempts = sum(r["attempts"] for r in results)
+    print(f"messages:      {len(messages)} ({failed} failed, {attempts} attempts)")
+    print(f"completion:    {percentiles([t - t0 for t in done_at])}  (time from start until each message finished)")
+    print(f"throughput:    {len(messages) / elapsed:.1f} msg/s ({elapsed:.2f}s, "
+          f"rate limit {rate}/s, {services.BULK_SEND_WORKERS} workers)")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--mode", choices=["webhook", "dispatch"], default="webhook")
+    parser.add_argument("--rate", type=float, default=100, help="הודעות לשנייה")
+    parser.add_argument("--duration", type=float, default=10, help="שניות")
+    parser.add_argument("--phones", type=int, default=1000)
+    parser.add_argument("--ai-share", type=float, default=0.3, help="איזה חלק מההודעות צריך AI")
+    parser.add_argument("--messages", type=int, default=300, help="מצב dispatch: כמה הודעות לשלוח")
+    parser.add_argument("--send-rate", type=float, default=None, help="מצב dispatch: הגבלת הקצב (ברירת מחדל GREEN_RATE_PER_SECOND)")
+    parser.add_argument("--target", default="", help="URL של webhook_server שכבר רץ (ריק = בתוך ה-process)")
+    parser.add_argument("--db", default="", help="קובץ ה-DB שאליו נזרעים המשלוחים (במצב --target: של השרת)")
+    parser.add_argument("--connections", type=int, default=200)
+    parser.add_argument("--drain-timeout", type=float, default=60)
+    parser.add_argument("--green-port", type=int, default=None)
+    parser.add_argument("--openai-port", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-ai-cache", action="store_true", help="כל הודעה חופשית הולכת ל-AI")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    green, openai = behaviours_from_args(args)
+    green_server, openai_server = start_stubs(green, openai, args.green_port, args.openai_port)
+
+    tmp = tempfile.mkdtemp()
+    store.DB_FILE = args.db or os.path.join(tmp, "load.db")
+    store.AUTO_MIGRATE = False
+    services.GREEN_API_URL = green_server.url
+    services.OPENAI_BASE_URL = openai_server.url + "/v1"
+    # בלי שורת לוג לכל שגיאה מכוונת של שרתי הדמה
+    metrics.LOG_LEVEL = "critical"
+    if args.no_ai_cache:
+        services.ai_cache = None
+    try:
+        if args.mode == "dispatch":
+            dispatch_mode(args, green_server.app)
+        else:
+            seed([f"97252{i:07d}" for i in range(args.phones)])
+            if args.target:
+                print(f"server env: GREEN_API_URL={green_server.url} OPENAI_BASE_URL={openai_server.url}/v1 "
+                      f"DB_FILE={store.DB_FILE}")
+            asyncio.run(webhook_mode(args, green_server.app))
+        print(f"stubs:         green {green.requests} requests ({green.errors} errors), "
+              f"openai {openai.requests} requests ({openai.errors} errors)")
+    finally:
+        green_server.stop()
+        openai_server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+מבחן עומס למקביליות: יורה אלפי webhooks במקביל (כמה הודעות לכל לקוח בו-זמנית),
+בזמן ש"app.py" מדומה יוצר מסלולים חדשים וכותב לאותם משלוחים (כמו סימון "נמסר"), ובודק בסוף שאף עדכון לא אבד.
+
+ה-AI והשליחה מוחלפים ב-stub מקומי, כך שלא יוצאות קריאות לשירותים חיצוניים.
+הרצה מתיקיית הפרויקט:
+    python benchmarks/stress_webhook.py [--phones 200] [--messages 10] [--queue sqlite] [--no-locks]
+
+--queue sqlite מריץ עם התור העמיד במקום התור שבזיכרון.
+--no-locks מבטל את הנעילה לפי טלפון. ההודעות של כל טלפון עדיין מטופלות אחת-אחת בגלל התור
+(שרשרת לכל טלפון), ולכן ההתנגשויות בפועל מגיעות מהכותב המקביל שמדמה את app.py - הוא זה שמפעיל
+את מסלול ה-compare-and-set (version) ב-save_with_retry. המבחן נכשל אם לא היו התנגשויות בכלל.
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+import metrics
+import store
+import webhook_server
+import work_queue
+
+
+SEED_BATCH = "ROUTE-20250101-080000"
+
+
+async def fake_ai(text, current_state):
+    # כל הודעה נראית כמו "note_<n>" - ה-"AI" מחלץ שדה ייחודי להודעה הזו
+    await asyncio.sleep(random.uniform(0, 0.005))
+    return {"extracted_data": {text: "yes"}, "reply_message": "👍"}
+
+
+async def fake_send(phone, message):
+    return True
+
+
+def payload(phone: str, text: str):
+    return {
+        "typeWebhook": "incomingMessageReceived",
+        "messageData": {"typeMessage": "textMessage", "textMessageData": {"textMessage": text}},
+        "senderData": {"chatId": f"{phone}@c.us"},
+    }
+
+
+def seed(phones):
+    batch_id = SEED_BATCH
+    store.save_batch(batch_id, {
+        "dispatcher_phone": "972500000000",
+        "upload_time": "2025-01-01 08:00",
+        "deliveries": [{"sequence_number": i + 1, "recipient_name": "לקוח", "recipient_phone": p,
+                        "status": "נשלח", "batch_id": batch_id} for i, p in enumerate(phones)],
+    })
+
+
+def dispatcher_writer(stop: threading.Event, created: list):
+    # מדמה את app.py שיוצר מסלולים חדשים (לטלפונים אחרים) באותו זמן
+    n = 0
+    while not stop.is_set():
+        batch_id = f"ROUTE-20250102-{n:06d}"
+        store.save_batch(batch_id, {
+            "dispatcher_phone": "972500000001", "upload_time": "2025-01-02 08:00",
+            "deliveries": [{"recipient_phone": f"97258{n:07d}", "status": "נשלח", "batch_id": batch_id}],
+        })
+        created.append(batch_id)
+        n += 1
+        time.sleep(0.01)
+
+
+def field_writer(stop: threading.Event, n_rows: int, touches: list):
+    # מדמה את app.py שכותב לאותם משלוחים בזמן שה-workers מעבדים הודעות (כמו סימון "נמסר"),
+    # כך שגרסת השורה משתנה בין הקריאה של ה-worker לכתיבה שלו
+    rnd = random.Random(2)
+    while not stop.is_set():
+        idx = rnd.randrange(n_rows)
+        k = touches[idx]
+        store.update_delivery_fields(SEED_BATCH, {idx: {f"touch_{k}": k}})
+        touches[idx] = k + 1
+        time.sleep(0.0005)
+
+
+async def fire(phones, messages):
+    transport = httpx.ASGITransport(app=webhook_server.app)
+    app = webhook_server.app
+    async with webhook_server.lifespan(app), httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        requests = [payload(p, f"note_{j}") for p in phones for j in range(messages)]
+        random.shuffle(requests)
+        t0 = time.perf_counter()
+        results = await asyncio.gather(*(client.post("/webhook", json=r) for r in requests))
+        # ה-webhook רק מכניס לתור - מחכים שה-workers יסיימו
+        await webhook_server.work_queue.join()
+        elapsed = time.perf_counter() - t0
+        print("queue:", webhook_server.work_queue.snapshot())
+    statuses = {}
+    for r in results:
+        s = r.json()["status"]
+        statuses[s] = statuses.get(s, 0) + 1
+    return elapsed, statuses
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--phones", type=int, default=200)
+    parser.add_argument("--messages", type=int, default=10)
+    parser.add_argument("--no-locks", action="store_true")
+    parser.add_argument("--queue", choices=["memory", "sqlite"], default="memory")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    store.DB_FILE = os.path.join(tmp, "stress.db")
+    work_queue.QUEUE_DB_FILE = os.path.join(tmp, "queue.db")
+    webhook_server.create_queue = lambda: work_queue.create_queue(args.queue)
+    store.AUTO_MIGRATE = False
+    # בלי שורת לוג לכל הודעה שטופלה
+    metrics.LOG_LEVEL = "warning"
+    webhook_server.analyze_text_with_ai_async = fake_ai
+    webhook_server.send_whatsapp_message_async = fake_send
+    webhook_server.is_duplicate_message = lambda phone, message, message_id=None: False
+    webhook_server.MAX_UPDATE_RETRIES = 1000
+    if args.no_locks:
+        webhook_server.get_phone_lock = lambda phone: contextlib.nullcontext()
+
+    # סופרים כמה עדכונים אופטימיים נדחו כי מישהו אחר כתב לשורה בינתיים
+    conflicts = [0]
+    update_delivery = store.update_delivery
+
+    def counting_update(batch_id, idx, delivery, expected_version=None):
+        ok = update_delivery(batch_id, idx, delivery, expected_version)
+        if not ok and expected_version is not None:
+            conflicts[0] += 1
+        return ok
+
+    store.update_delivery = counting_update
+
+    phones = [f"97252{i:07d}" for i in range(args.phones)]
+    seed(phones)
+
+    stop, created, touches = threading.Event(), [], [0] * len(phones)
+    writers = [threading.Thread(target=dispatcher_writer, args=(stop, created)),
+               threading.Thread(target=field_writer, args=(stop, len(phones), touches))]
+    for writer in writers:
+        writer.start()
+    elapsed, statuses = asyncio.run(fire(phones, args.messages))
+    stop.set()
+    for writer in writers:
+        writer.join()
+
+    total = args.phones * args.messages
+    print(f"{total} webhooks in {elapsed:.2f}s ({total / elapsed:,.0f}/s) statuses={statuses}")
+
+    # בדיקת מצב סופי: כל הודעה של כל לקוח הותירה את השדה שלה
+    lost = 0
+    for i, p in enumerate(phones):
+        _, _, d = store.find_active_delivery(p)
+        missing = [j for j in range(args.messages) if d.get(f"note_{j}") != "yes"]
+        missing += [k for k in range(touches[i]) if d.get(f"touch_{k}") != k]
+        lost += len(missing)
+        assert d["version"] == args.messages + touches[i], (p, d["version"])
+    for batch_id in created:
+        assert store.get_batch(batch_id) is not None, batch_id
+
+    print(f"lost updates: {lost}, version conflicts retried: {conflicts[0]}, "
+          f"concurrent field writes: {sum(touches)}, dispatcher routes created meanwhile: {len(created)}")
+    if lost or not conflicts[0] or statuses.get("queued") != total:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
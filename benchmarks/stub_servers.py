@@ -0,0 +1,185 @@
+"""
+שרתי דמה מקומיים לבדיקות עומס - במקום Green API ו-OpenAI, בלי עלות ובלי רשת:
+- Green API: POST /waInstance{id}/sendMessage/{token} -> {"idMessage": ...}
+- OpenAI:    POST /v1/chat/completions -> תשובת chat completion שה-content שלה הוא ה-JSON שה-webhook מצפה לו
+לכל שרת זמן תגובה (ממוצע + פיזור) ואחוז שגיאות (500 / 429) שניתנים להגדרה.
+
+הרצה עצמאית (ואז להריץ את webhook_server עם המשתנים שמודפסים):
+    python benchmarks/stub_servers.py --green-latency 0.15 --openai-latency 0.8 --openai-error-rate 0.02
+"""
+import argparse
+import asyncio
+import json
+import random
+import socket
+import threading
+import time
+import uuid
+from collections import defaultdict
+from typing import Optional
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+
+# תשובות "AI" לדוגמה - כל אחת במבנה של analyze_text_with_ai
+AI_REPLIES = [
+    {"extracted_data": {"someone_home": "yes"}, "reply_message": "מעולה, נתראה בקרוב 📦"},
+    {"extracted_data": {"someone_home": "no"}, "reply_message": "אין בעיה, איפה להשאיר את המשלוח?"},
+    {"extracted_data": {"drop_location": "ליד הדלת"}, "reply_message": "סגור, אשאיר ליד הדלת. באיזו קומה?"},
+    {"extracted_data": {}, "reply_message": "סליחה, לא הבנתי. תוכל לחזור על זה?"},
+]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class StubBehaviour:
+    """
+    זמן תגובה ושגיאות של שרת דמה: latency שניות בממוצע, ±jitter (יחסי), error_rate מהבקשות נכשלות.
+    """
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.5, error_rate: float = 0.0,
+                 rate_limit_share: float = 0.5):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        # איזה חלק מהשגיאות הוא 429 (הגבלת קצב) ולא 500
+        self.rate_limit_share = rate_limit_share
+        self.requests = 0
+        self.errors = 0
+
+    async def delay(self):
+        if self.latency > 0:
+            await asyncio.sleep(max(0.0, self.latency * (1 + random.uniform(-self.jitter, self.jitter))))
+
+    def error_status(self) -> Optional[int]:
+        self.requests += 1
+        if random.random() >= self.error_rate:
+            return None
+        self.errors += 1
+        return 429 if random.random() < self.rate_limit_share else 500
+
+
+def create_green_app(behaviour: StubBehaviour) -> FastAPI:
+    app = FastAPI()
+    # זמני ההגעה של הודעות יוצאות לכל טלפון - בשביל מדידת זמן תגובה מקצה לקצה
+    app.state.received = defaultdict(list)
+
+    @app.post("/waInstance{instance}/sendMessage/{token}")
+    async def send_message(instance: str, token: str, request: Request):
+        body = await request.json()
+        phone = str(body.get("chatId", "")).replace("@c.us", "")
+        app.state.received[phone].append(time.perf_counter())
+        await behaviour.delay()
+        status = behaviour.error_status()
+        if status:
+            return JSONResponse({"message": "stub error"}, status_code=status)
+        return {"idMessage": uuid.uuid4().hex.upper()}
+
+    return app
+
+
+def create_openai_app(behaviour: StubBehaviour) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/v1/chat/completions")
+    async def chat_completions(request: Request):
+        body = await request.json()
+        await behaviour.delay()
+        status = behaviour.error_status()
+        if status:
+            return JSONResponse({"error": {"message": "stub error", "type": "server_error", "code": None}},
+                                status_code=status)
+        prompt_tokens = sum(len(str(m.get("content", ""))) // 3 for m in body.get("messages", []))
+        content = json.dumps(random.choice(AI_REPLIES), ensure_ascii=False)
+        return {
+            "id": "chatcmpl-" + uuid.uuid4().hex,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "stub"),
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": len(content) // 3,
+                      "total_tokens": prompt_tokens + len(content) // 3,
+                      "prompt_tokens_details": {"cached_tokens": 0}},
+        }
+
+    return app
+
+
+class StubServer:
+    """
+    מריץ אפליקציית דמה ב-uvicorn ב-thread רקע.
+    """
+
+    def __init__(self, app: FastAPI, port: Optional[int] = None):
+        self.app = app
+        self.port = port or free_port()
+        self.server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=self.port,
+                                                    log_level="warning", access_log=False))
+        self._thread = threading.Thread(target=self.server.run, daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self):
+        self._thread.start()
+        while not self.server.started:
+            time.sleep(0.01)
+        return self
+
+    def stop(self):
+        self.server.should_exit = True
+        self._thread.join(timeout=5)
+
+
+def start_stubs(green: StubBehaviour, openai: StubBehaviour,
+                green_port: Optional[int] = None, openai_port: Optional[int] = None):
+    green_server = StubServer(create_green_app(green), green_port).start()
+    openai_server = StubServer(create_openai_app(openai), openai_port).start()
+    return green_server, openai_server
+
+
+def add_stub_arguments(parser: argparse.ArgumentParser):
+    parser.add_argument("--green-latency", type=float, default=0.15, help="שניות")
+    parser.add_argument("--green-error-rate", type=float, default=0.0)
+    parser.add_argument("--openai-latency", type=float, default=0.8, help="שניות")
+    parser.add_argument("--openai-error-rate", type=float, default=0.0)
+    parser.add_argument("--jitter", type=float, default=0.5, help="פיזור יחסי סביב זמן התגובה")
+
+
+def behaviours_from_args(args):
+    return (StubBehaviour(args.green_latency, args.jitter, args.green_error_rate),
+            StubBehaviour(args.openai_latency, args.jitter, args.openai_error_rate))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_stub_arguments(parser)
+    parser.add_argument("--green-port", type=int, default=9101)
+    parser.add_argument("--openai-port", type=int, default=9102)
+    args = parser.parse_args()
+
+    green, openai = behaviours_from_args(args)
+    green_server, openai_server = start_stubs(green, openai, args.green_port, args.openai_port)
+    print("stubs running. start the server with:")
+    print(f"    GREEN_API_URL={green_server.url} OPENAI_BASE_URL={openai_server.url}/v1 python webhook_server.py")
+    try:
+        while True:
+            time.sleep(5)
+            print(f"green: {green.requests} requests ({green.errors} errors)  "
+                  f"openai: {openai.requests} requests ({openai.errors} errors)")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        green_server.stop()
+        openai_server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+# ========= הגדרות =========
+
+DEDUP_BACKEND = os.environ.get("DEDUP_BACKEND", "memory")  # memory | sqlite
+DEDUP_DB_FILE = os.environ.get("DEDUP_DB_FILE", "dedup.db")
+DEDUP_WINDOW_SECONDS = float(os.environ.get("DEDUP_WINDOW_SECONDS", 60))
+DEDUP_MAX_ENTRIES = int(os.environ.get("DEDUP_MAX_ENTRIES", 100_000))
+# ב-SQLite: כל כמה בדיקות למחוק רשומות שפג תוקפן
+DEDUP_PURGE_EVERY = int(os.environ.get("DEDUP_PURGE_EVERY", 1000))
+
+
+def message_key(phone: str, text: str, message_id: Optional[str] = None) -> str:
+    """
+    מפתח יציב להודעה: ה-idMessage של Green API אם קיים (זהה בכל שליחה חוזרת של אותו webhook),
+    אחרת digest של טלפון+טקסט (לא hash() של פייתון, שמשתנה בין processes).
+    """
+    if message_id:
+        return "id:" + message_id
+    return "sha1:" + hashlib.sha1(f"{phone}\x00{text}".encode("utf8")).hexdigest()
+
+
+class MemoryDeduplicator:
+    """
+    חלון זמן בזיכרון. הרשומות נשמרות לפי סדר ההכנסה (ולכן גם לפי זמן התפוגה, כי החלון קבוע),
+    כך שניקוי רשומות ישנות הוא רק הוצאה מהראש - O(1) amortized. מוגבל ל-max_entries רשומות.
+    """
+
+    def __init__(self, window_seconds: float = DEDUP_WINDOW_SECONDS, max_entries: int = DEDUP_MAX_ENTRIES):
+        self.window_seconds = window_seconds
+        self.max_entries = max_entries
+        self._seen: "OrderedDict[str, float]" = OrderedDict()  # key -> expires_at
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        seen = self._seen
+        while seen:
+            key, expires_at = next(iter(seen.items()))
+            if expires_at > now and len(seen) <= self.max_entries:
+                break
+            seen.popitem(last=False)
+
+    def check_and_add(self, key: str) -> bool:
+        """
+        מחזיר True אם ההודעה כבר נראתה בחלון הזמן (כפילות); אחרת רושם אותה ומחזיר False.
+        """
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            expires_at = self._seen.get(key)
+            if expires_at is not None and expires_at > now:
+                return True
+            self._seen.pop(key, None)
+            self._seen[key] = now + self.window_seconds
+            self._expire(now)
+            return False
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+
+class SQLiteDeduplicator:
+    """
+    חלון זמן משותף בקובץ SQLite - כל ה-workers של uvicorn (וגם אחרי restart) רואים אותו חלון.
+    הבדיקה וההכנסה הן פקודה אטומית אחת, כך ששני workers לא יכולים שניהם "לזכות" באותה הודעה.
+    """
+
+    def __init__(self, path: str = DEDUP_DB_FILE, window_seconds: float = DEDUP_WINDOW_SECONDS,
+                 purge_every: int = DEDUP_PURGE_EVERY):
+        self.window_seconds = window_seconds
+        self.purge_every = purge_every
+        self._calls = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS seen (key TEXT PRIMARY KEY, expires_at REAL NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS ix_seen_expires ON seen(expires_at)")
+
+    def check_and_add(self, key: str) -> bool:
+        # זמן קיר (ולא monotonic) כי הערכים משותפים בין processes
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO seen (key, expires_at) VALUES (?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET expires_at = excluded.expires_at WHERE seen.expires_at <= ?",
+                (key, now + self.window_seconds, now),
+            )
+            self._calls += 1
+            if self._calls % self.purge_every == 0:
+                self._conn.execute("DELETE FROM seen WHERE expires_at <= ?", (now,))
+        return cur.rowcount == 0
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM seen").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_deduplicator(backend: str = DEDUP_BACKEND):
+    if backend == "sqlite":
+        return SQLiteDeduplicator()
+    if backend == "memory":
+        return MemoryDeduplicator()
+    raise ValueError(f"Unknown DEDUP_BACKEND: {backend}")
@@ -0,0 +1,83 @@
+import os
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Sequence, Union
+
+import numpy as np
+
+# ========= הגדרות =========
+
+ETA_BASE_DELAY_MINUTES = int(os.environ.get("ETA_BASE_DELAY_MINUTES", 30))
+ETA_SERVICE_MINUTES = float(os.environ.get("ETA_SERVICE_MINUTES", 5))
+ETA_WINDOW_MINUTES = int(os.environ.get("ETA_WINDOW_MINUTES", 120))
+
+# סטטוסים של משלוח שכבר נמסר (store.DELIVERED_STATUS, מסומן במסך השליח) - לא מקבל חלון זמן בחישוב מחדש
+DELIVERED_STATUSES = ("נמסר",)
+
+MINUTES_PER_DAY = 24 * 60
+
+# טבלה מוכנה מראש של "HH:MM" לכל דקה ביממה - הפורמט הוא שליפה מהטבלה ולא strftime לכל עצירה
+_HHMM = np.array([f"{m // 60:02d}:{m % 60:02d}" for m in range(MINUTES_PER_DAY)])
+
+
+def stop_offsets(n_stops: int,
+                 service_minutes: Union[float, Sequence[float]] = ETA_SERVICE_MINUTES,
+                 base_delay: float = ETA_BASE_DELAY_MINUTES,
+                 start_position: int = 1) -> np.ndarray:
+    """
+    דקות מתחילת המסלול עד תחילת החלון של כל עצירה.
+    service_minutes יכול להיות מספר אחד (זמן קבוע לכל עצירה) או מערך עם זמן לכל עצירה.
+    עם זמן קבוע זו בדיוק הנוסחה הישנה: base + position * service (start_position רלוונטי רק למצב הזה).
+    """
+    if np.ndim(service_minutes) == 0:
+        positions = np.arange(start_position, start_position + n_stops, dtype=np.float64)
+        return base_delay + positions * float(service_minutes)
+    service = np.asarray(service_minutes, dtype=np.float64)
+    if len(service) != n_stops:
+        raise ValueError("service_minutes must have one value per stop")
+    return base_delay + np.cumsum(service)
+
+
+def format_windows(start_time: datetime, offsets: np.ndarray,
+                   window_minutes: int = ETA_WINDOW_MINUTES) -> List[str]:
+    start_minute = start_time.hour * 60 + start_time.minute
+    begin = (start_minute + np.floor(offsets).astype(np.int64)) % MINUTES_PER_DAY
+    end = (begin + int(window_minutes)) % MINUTES_PER_DAY
+    return np.char.add(np.char.add(_HHMM[begin], "-"), _HHMM[end]).tolist()
+
+
+def compute_route_windows(n_stops: int,
+                          start_time: Optional[datetime] = None,
+                          service_minutes: Union[float, Sequence[float]] = ETA_SERVICE_MINUTES,
+                          window_minutes: int = ETA_WINDOW_MINUTES,
+                          base_delay: float = ETA_BASE_DELAY_MINUTES,
+                          start_position: int = 1) -> List[str]:
+    """
+    מחשב את חלונות ההגעה ("HH:MM-HH:MM") לכל עצירות המסלול במעבר אחד, מזמן התחלה אחד.
+    """
+    if n_stops <= 0:
+        return []
+    if start_time is None:
+        start_time = datetime.now()
+    offsets = stop_offsets(n_stops, service_minutes, base_delay, start_position)
+    return format_windows(start_time, offsets, window_minutes)
+
+
+def recompute_remaining_windows(deliveries: List[Dict[str, Any]],
+                                now: Optional[datetime] = None,
+                                service_minutes: float = ETA_SERVICE_MINUTES,
+                                window_minutes: int = ETA_WINDOW_MINUTES,
+                                base_delay: float = 0,
+                                delivered_statuses: Sequence[str] = DELIVERED_STATUSES) -> Dict[int, str]:
+    """
+    מחשב מחדש חלונות לעצירות שעוד לא נמסרו, מעכשיו ולפי סדר sequence_number.
+    מעדכן את estimated_time_range בכל משלוח שנותר ומחזיר {אינדקס ברשימה: חלון חדש}.
+    """
+    remaining = [i for i, d in enumerate(deliveries) if d.get("status") not in delivered_statuses]
+    if not remaining:
+        return {}
+    remaining.sort(key=lambda i: (deliveries[i].get("sequence_number") or 0, i))
+    windows = compute_route_windows(len(remaining), now, service_minutes, window_minutes, base_delay)
+    updated = dict(zip(remaining, windows))
+    for i, window in updated.items():
+        deliveries[i]["estimated_time_range"] = window
+    return updated
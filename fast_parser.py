@@ -0,0 +1,155 @@
+import re
+from typing import Dict, Any, Optional
+
+# ========= מילונים ותבניות =========
+
+# מקומות השארה שמסיימים את התיאום (אותם מקומות שה-webhook בודק כדי לסמן "מלא")
+DROP_OFF_KEYWORDS = ("שומר", "לובי", "קבלה")
+
+YES_WORDS = frozenset({
+    "כן", "כ", "yes", "בטח", "ברור", "בטוח", "נכון", "יש", "יהיה", "אני בבית", "יהיה מישהו",
+    "יש מישהו", "כן יהיה", "כן אני בבית", "כן יש", "כן יהיה מישהו", "בבית",
+})
+# "אוקי" / "סבבה" הם לרוב אישור שקראו את ההודעה ולא תשובה לשאלה - לא נכנסים ל-YES_WORDS והולכים ל-AI
+NO_WORDS = frozenset({
+    "לא", "no", "אין", "לא יהיה", "אין אף אחד", "לא יהיה אף אחד", "אף אחד", "לא בבית",
+    "אני לא בבית", "לא אהיה", "לא יהיה מישהו", "אין מישהו", "לא נמצא", "לא אהיה בבית",
+})
+
+# מילים שלא משנות את המשמעות (נמחקות לפני הבדיקה שכל ההודעה הובנה)
+_FILLER_RE = re.compile(r"\b(?:תודה(?:\s+רבה)?|בבקשה|אחי|אחלה|סבבה|ו?אפשר|פשוט|רק|גם|יש|זה)\b")
+_PUNCT_RE = re.compile(r"[\s.,!?;:\-–—()\"'׳״🙏😊👍📦❤️]+")
+
+_DROP_RE = re.compile(
+    r"(?<!\w)(?:(?:ת|נא\s+ל|ל)?(?:שאיר|השאיר|שים|הניח|ניח|מסור)\w*\s*(?:את\s*ה?(?:משלוח|חבילה)\s*)?)?"
+    r"(?:ב|ל|אצל\s*ה|ליד\s*ה|עם\s*ה)?"
+    r"(?P<loc>לובי|שומר|קבלה|דלת)\b"
+)
+_FLOOR_RE = re.compile(r"(?:קומה|קומת|ק['׳])\s*:?\s*(?P<v>-?\d{1,3})")
+_APARTMENT_RE = re.compile(r"(?:דירה|דירת|ד['׳])\s*:?\s*(?P<v>\d{1,4}[א-ת]?)")
+_CODE_RE = re.compile(
+    r"(?:ה?קוד(?:\s+(?:כניסה|לבניין|לדלת|בכניסה|של\s+הבניין))?|אינטרקום)\s*(?:הוא|זה)?\s*:?\s*(?P<v>[\d#*]{2,10})"
+)
+
+# שלילה צמודה למקום ("לא בלובי", "אל תשאיר לשומר") - הפוך ממה שהמסלול המהיר מבין, אז הולכים ל-AI
+_NEGATED_DROP_RE = re.compile(r"(?<!\w)(?:לא|אל)\s*$")
+# "אין אף אחד בבית" וכו' - שלילה שמדברת על הבית ולא על המקום
+_NOT_HOME_RE = re.compile(
+    r"(?<!\w)(?:(?:לא|אף\s+אחד\s+לא)\s*(?:בבית|יהיה|אהיה|נמצא)|אין\s+אף\s+אחד(?:\s*(?:בבית|יהיה|נמצא))?)(?!\w)"
+)
+
+_LOCATION_NAMES = {"לובי": "לובי", "שומר": "שומר", "קבלה": "קבלה", "דלת": "ליד הדלת"}
+_LOCATION_PHRASES = {"לובי": "בלובי", "שומר": "אצל השומר", "קבלה": "בקבלה"}
+
+
+# ========= תשובות מוכנות =========
+
+REPLY_DONE_HOME = "מעולה, תודה! 😊 נתראה בקרוב עם המשלוח 📦"
+REPLY_DONE_DROP = "סגור, אשאיר את המשלוח {location} 📦 תודה!"
+REPLY_DONE_DETAILS = "תודה! יש לי את כל הפרטים, המשלוח בדרך 📦😊"
+REPLY_ASK_HOME = "תודה! 🙂 האם יהיה מישהו בבית בשעות המשלוח? (כן / לא)"
+REPLY_ASK_LOCATION = "אין בעיה 🙂 איפה להשאיר את המשלוח? (למשל לובי / שומר / ליד הדלת)"
+REPLY_ASK_FIELD = {
+    "floor": "באיזו קומה? 🙂",
+    "apartment": "מה מספר הדירה?",
+    "entrance_code": "יש קוד כניסה לבניין? אם כן, מה הוא?",
+}
+
+
+# ========= פענוח =========
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text.strip().lower())
+
+
+def _is_residual_empty(text: str) -> bool:
+    # אחרי מחיקת כל מה שזוהה - האם נשאר משהו שלא הבנו?
+    text = _FILLER_RE.sub(" ", text)
+    return not _PUNCT_RE.sub("", text)
+
+
+def is_finished(state: Dict[str, Any]) -> bool:
+    if state.get("someone_home") == "yes":
+        return True
+    if state.get("drop_location") and any(x in str(state.get("drop_location")) for x in DROP_OFF_KEYWORDS):
+        return True
+    return bool(state.get("apartment") and state.get("floor") and state.get("entrance_code"))
+
+
+def _reply_for(state: Dict[str, Any]) -> str:
+    if state.get("someone_home") == "yes":
+        return REPLY_DONE_HOME
+    location = state.get("drop_location")
+    for keyword in DROP_OFF_KEYWORDS:
+        if location and keyword in str(location):
+            return REPLY_DONE_DROP.format(location=_LOCATION_PHRASES[keyword])
+    if is_finished(state):
+        return REPLY_DONE_DETAILS
+    # אותו סדר כמו בפרומפט של ה-AI: קודם בבית, אחר כך איפה להשאיר, ואז פרטים טכניים
+    if state.get("someone_home") is None and not location:
+        return REPLY_ASK_HOME
+    technical = any(state.get(k) for k in ("floor", "apartment", "entrance_code"))
+    if state.get("someone_home") == "no" and not location and not technical:
+        return REPLY_ASK_LOCATION
+    for key in ("floor", "apartment", "entrance_code"):
+        if not state.get(key):
+            return REPLY_ASK_FIELD[key]
+    return REPLY_DONE_DETAILS
+
+
+def extract(text: str, current_state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    מחלץ שדות מהודעה בלי AI. מחזיר None אם ההודעה לא הובנה במלואה.
+    """
+    norm = _normalize(text)
+    if not norm:
+        return None
+
+    # תשובת כן/לא חד-משמעית - רלוונטית רק כשהשאלה הפתוחה היא "האם יהיה מישהו בבית".
+    # אם כבר נאסף פרט כלשהו, ייתכן שהבוט שאל משהו אחר (למשל "יש קוד כניסה?") - שה-AI יחליט
+    bare = _PUNCT_RE.sub(" ", norm).strip()
+    if bare in YES_WORDS or bare in NO_WORDS:
+        known = ("someone_home", "drop_location", "floor", "apartment", "entrance_code")
+        if any(current_state.get(k) for k in known):
+            return None
+        return {"someone_home": "yes" if bare in YES_WORDS else "no"}
+
+    extracted: Dict[str, Any] = {}
+    rest = norm
+
+    for key, pattern in (("floor", _FLOOR_RE), ("apartment", _APARTMENT_RE), ("entrance_code", _CODE_RE)):
+        matches = list(pattern.finditer(rest))
+        if len(matches) > 1:
+            return None  # שתי קומות / שני קודים - עדיף שה-AI יבין
+        if matches:
+            extracted[key] = matches[0].group("v")
+            rest = pattern.sub(" ", rest)
+
+    drops = list(_DROP_RE.finditer(rest))
+    if len(drops) > 1:
+        return None
+    if drops:
+        if _NEGATED_DROP_RE.search(rest[:drops[0].start()]):
+            return None
+        extracted["drop_location"] = _LOCATION_NAMES[drops[0].group("loc")]
+        rest = _DROP_RE.sub(" ", rest)
+        # "לא בבית, תשאיר בלובי" - אם לא ידוע אם יש מישהו בבית, השארה מרמזת שאין
+        rest, negated = _NOT_HOME_RE.subn(" ", rest)
+        if negated or current_state.get("someone_home") is None:
+            extracted["someone_home"] = "no"
+
+    if not extracted or not _is_residual_empty(rest):
+        return None
+    return extracted
+
+
+def fast_parse(text: str, current_state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    מסלול מהיר לפני ה-AI: אם ההודעה מובנת בביטחון מלא, מחזיר תשובה באותו מבנה של
+    analyze_text_with_ai ({"extracted_data", "reply_message"}). אחרת None - וההודעה הולכת ל-AI.
+    """
+    extracted = extract(text, current_state)
+    if extracted is None:
+        return None
+    merged = {**current_state, **{k: v for k, v in extracted.items() if v is not None}}
+    return {"extracted_data": extracted, "reply_message": _reply_for(merged)}
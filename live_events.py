@@ -0,0 +1,207 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Any, List, Optional, AsyncIterator, Tuple
+
+import httpx
+
+# ========= צד השרת (webhook_server) =========
+
+EVENT_BUFFER_SIZE = 5000
+KEEPALIVE_SECONDS = 15
+# צד הלקוח: חיבור שאף מסך לא קרא ממנו X שניות (כל ה-sessions של השליח נסגרו) נסגר לבד
+LIVE_FEED_IDLE_SECONDS = float(os.environ.get("LIVE_FEED_IDLE_SECONDS", 120))
+
+
+class EventBus:
+    """
+    מפיץ אירועי "משלוח השתנה" למנויים לפי טלפון שליח. שומר חוצץ של האירועים האחרונים,
+    כך שלקוח שהתנתק לרגע ממשיך מ-Last-Event-ID בלי לפספס עדכונים.
+    האירועים חיים בזיכרון של ה-process - עם כמה workers של uvicorn כל worker מפיץ רק את מה שהוא עיבד.
+    מזהה אירוע הוא "<epoch>-<מספר>": אחרי restart המספור מתחיל מחדש, וה-epoch מראה שה-Last-Event-ID
+    של הלקוח שייך ל-process קודם (ואז הוא מקבל reset ולא רשימה חלקית).
+    """
+
+    def __init__(self, buffer_size: int = EVENT_BUFFER_SIZE):
+        self.epoch = format(int(time.time() * 1000), "x")
+        self._next_id = 1
+        self._buffer: deque = deque(maxlen=buffer_size)  # (id, dispatcher_phone, event, data)
+        self._subscribers: Dict[str, List[asyncio.Queue]] = {}
+
+    def publish(self, dispatcher_phone: str, data: Dict[str, Any], event: str = "delivery") -> int:
+        event_id = self._next_id
+        self._next_id += 1
+        item = (event_id, dispatcher_phone, event, data)
+        self._buffer.append(item)
+        for q in self._subscribers.get(dispatcher_phone, ()):
+            q.put_nowait(item)
+        return event_id
+
+    def event_id(self, number: int) -> str:
+        return f"{self.epoch}-{number}"
+
+    def parse_event_id(self, value: Optional[str]) -> Optional[int]:
+        """
+        המספר מתוך Last-Event-ID, או None אם הוא לא תקין או שייך ל-process אחר.
+        """
+        epoch, _, number = (value or "").strip().rpartition("-")
+        if epoch != self.epoch or not number.isdigit():
+            return None
+        return int(number)
+
+    def backlog(self, dispatcher_phone: str, last_event_id: Optional[int]) -> Optional[list]:
+        """
+        האירועים שאחרי last_event_id. None אם אי אפשר לדעת מה הלקוח פספס (מזהה לא מוכר, או שחלק
+        מהאירועים כבר נזרקו מהחוצץ) - ואז הלקוח צריך טעינה מלאה.
+        """
+        if last_event_id is None or last_event_id >= self._next_id:
+            return None
+        if self._buffer and last_event_id < self._buffer[0][0] - 1:
+            return None
+        return [item for item in self._buffer if item[0] > last_event_id and item[1] == dispatcher_phone]
+
+    async def stream(self, dispatcher_phone: str, last_event_id: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        גנרטור של הודעות SSE (text/event-stream) לשליח אחד. last_event_id הוא ה-header כפי שהגיע.
+        """
+        q: asyncio.Queue = asyncio.Queue()
+        self._subscribers.setdefault(dispatcher_phone, []).append(q)
+        try:
+            yield "retry: 1000\n\n"
+            if last_event_id:
+                backlog = self.backlog(dispatcher_phone, self.parse_event_id(last_event_id))
+                if backlog is None:
+                    yield format_sse(self.event_id(self._next_id - 1), "reset", {})
+                else:
+                    for item in backlog:
+                        yield format_sse(self.event_id(item[0]), item[2], item[3])
+            while True:
+                try:
+                    event_id, _, event, data = await asyncio.wait_for(q.get(), KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                yield format_sse(self.event_id(event_id), event, data)
+        finally:
+            subscribers = self._subscribers.get(dispatcher_phone, [])
+            if q in subscribers:
+                subscribers.remove(q)
+            if not subscribers:
+                self._subscribers.pop(dispatcher_phone, None)
+
+
+def format_sse(event_id: str, event: str, data: Dict[str, Any]) -> str:
+    return f"id: {event_id}\nevent: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+# ========= צד הלקוח (app.py) =========
+
+class LiveFeed:
+    """
+    מחזיק חיבור SSE פתוח ל-webhook_server ב-thread רקע ושומר את האירועים האחרונים בחוצץ.
+    חיבור אחד משותף לכל ה-sessions של אותו שליח: כל מסך קורא ל-read(cursor) עם המיקום שלו
+    בכל ריענון - בלי שאילתות ל-DB ובלי לחכות לרשת. אם אף מסך לא קרא LIVE_FEED_IDLE_SECONDS, החיבור נסגר.
+    """
+
+    def __init__(self, base_url: str, dispatcher_phone: str, token: str = "",
+                 buffer_size: int = EVENT_BUFFER_SIZE, idle_seconds: float = LIVE_FEED_IDLE_SECONDS):
+        self.base_url = base_url.rstrip("/")
+        self.dispatcher_phone = dispatcher_phone
+        self.token = token
+        self.idle_seconds = idle_seconds
+        self.last_event_id: Optional[str] = None
+        self.connected = False
+        self._events: deque = deque(maxlen=buffer_size)  # (מספר רץ, event, data)
+        self._position = 0
+        self._lock = threading.Lock()
+        self._last_read = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def alive(self) -> bool:
+        return self._thread.is_alive() and not self._idle()
+
+    @property
+    def position(self) -> int:
+        self._last_read = time.monotonic()
+        return self._position
+
+    def read(self, cursor: int) -> Tuple[int, List[tuple]]:
+        """
+        האירועים שאחרי cursor כרשימת (event, data), והמיקום החדש. אם חלק מהם כבר יצאו מהחוצץ,
+        הרשימה מתחילה ב-("reset", {}) - המסך צריך טעינה מלאה.
+        """
+        self._last_read = time.monotonic()
+        with self._lock:
+            items = [(event, data) for n, event, data in self._events if n > cursor]
+            if self._events and cursor < self._events[0][0] - 1:
+                items.insert(0, ("reset", {}))
+            return self._position, items
+
+    def _append(self, event: str, data: Dict[str, Any]):
+        with self._lock:
+            self._position += 1
+            self._events.append((self._position, event, data))
+
+    def _idle(self) -> bool:
+        if time.monotonic() - self._last_read > self.idle_seconds:
+            self._stop.set()
+        return self._stop.is_set()
+
+    def _run(self):
+        backoff = 1.0
+        while not self._idle():
+            try:
+                self._listen()
+                backoff = 1.0
+            except (httpx.HTTPError, ValueError) as e:
+                print("❌ חיבור לעדכונים החיים נכשל:", e)
+            self.connected = False
+            self._stop.wait(backoff)
+            backoff = min(backoff * 2, 30)
+
+    def _listen(self):
+        headers = {"Accept": "text/event-stream"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        if self.last_event_id is not None:
+            headers["Last-Event-ID"] = self.last_event_id
+        params = {"dispatcher": self.dispatcher_phone}
+        timeout = httpx.Timeout(5, read=KEEPALIVE_SECONDS * 3)
+        with httpx.stream("GET", f"{self.base_url}/events", params=params, headers=headers,
+                          timeout=timeout) as resp:
+            resp.raise_for_status()
+            self.connected = True
+            event, data, event_id = "message", [], None
+            for line in resp.iter_lines():
+                if self._idle():
+                    return
+                if not line:
+                    # שורה ריקה = סוף אירוע
+                    if data:
+                        self._append(event, json.loads("\n".join(data)))
+                        if event_id is not None:
+                            self.last_event_id = event_id
+                    event, data, event_id = "message", [], None
+                elif line.startswith(":"):
+                    continue
+                else:
+                    name, _, value = line.partition(":")
+                    value = value[1:] if value.startswith(" ") else value
+                    if name == "event":
+                        event = value
+                    elif name == "data":
+                        data.append(value)
+                    elif name == "id":
+                        event_id = value
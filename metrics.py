@@ -0,0 +1,223 @@
+import contextvars
+import json
+import math
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+# ========= הגדרות =========
+
+METRICS_PREFIX = os.environ.get("METRICS_PREFIX", "buzz")
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "json")  # json | text
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "info")
+
+# גבולות ה-buckets בשניות: מ-1ms (חיפוש באינדקס) ועד 30s (AI איטי)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40, "critical": 50}
+
+
+# ========= מדדים (פורמט הטקסט של Prometheus) =========
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = f"{METRICS_PREFIX}_{name}" if METRICS_PREFIX else name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[n]) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}_total{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+        self._series: Dict[Tuple[str, ...], list] = {}  # key -> [counts per bucket, sum, count]
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, [list(s[0]), s[1], s[2]]) for k, s in self._series.items())
+        lines = self.header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = ("le", _format_value(bound))
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class Gauge(_Metric):
+    """
+    ערך נוכחי שנקרא בזמן ה-scrape (עומק התור וכו') דרך פונקציה.
+    """
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, callback):
+        super().__init__(name, documentation)
+        self.callback = callback
+
+    def collect(self) -> List[str]:
+        try:
+            value = self.callback()
+        except Exception:
+            return []
+        if value is None:
+            return []
+        return self.header() + [f"{self.name} {_format_value(value)}"]
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def gauge(name: str, documentation: str, callback) -> Gauge:
+    return REGISTRY.register(Gauge(name, documentation, callback))
+
+
+# המדדים של המערכת - מוגדרים כאן כדי שכל מודול ירשום לאותם אובייקטים
+stage_seconds = histogram(
+    "stage_duration_seconds", "Time spent in each message-processing stage", ("stage",))
+webhook_requests = counter(
+    "webhook_requests", "Incoming webhook calls by outcome (queued/duplicate/ignored/error)", ("status",))
+messages_processed = counter(
+    "messages_processed", "Messages handled by the workers by outcome (ok/not_found/error)", ("status",))
+reply_source = counter(
+    "reply_source", "Where the reply came from (fast_path/ai_cache/ai/ai_fallback)", ("source",))
+ai_requests = counter(
+    "ai_requests", "OpenAI chat completion calls by result (ok/error)", ("result",))
+green_api_requests = counter(
+    "green_api_requests", "Green API sendMessage calls by result (ok/error)", ("result",))
+
+
+# ========= לוגים מובנים =========
+
+# מזהה ההודעה שבטיפול, עובר אוטומטית לכל log_event באותה משימה (גם דרך await)
+trace_id_var: contextvars.ContextVar = contextvars.ContextVar("trace_id", default=None)
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def log_event(event: str, level: str = "info", **fields):
+    """
+    שורת לוג אחת כ-JSON (ts, level, event, trace_id ושאר השדות), ל-stdout.
+    LOG_FORMAT=text כותב אותה שורה בפורמט קריא לפיתוח מקומי.
+    """
+    if _LEVELS.get(level, 20) < _LEVELS.get(LOG_LEVEL, 20):
+        return
+    record: Dict[str, Any] = {"ts": round(time.time(), 3), "level": level, "event": event}
+    trace_id = trace_id_var.get()
+    if trace_id:
+        record["trace_id"] = trace_id
+    record.update(fields)
+    if LOG_FORMAT == "text":
+        extra = " ".join(f"{k}={v}" for k, v in record.items() if k not in ("ts", "level", "event"))
+        line = f"{time.strftime('%H:%M:%S')} {level.upper():<7} {event} {extra}"
+    else:
+        line = json.dumps(record, ensure_ascii=False, default=str)
+    print(line, file=sys.stdout, flush=True)
@@ -0,0 +1,202 @@
+import gzip
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+
+import store
+from phones import normalize_phone
+
+# ========= הגדרות =========
+
+ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", "archive")
+# מסלול שכל המשלוחים בו "מלא" / "נמסר" נשאר זמין במסך השליח עוד X שעות, ואז עובר לארכיון
+RETENTION_CLOSED_AFTER_HOURS = float(os.environ.get("RETENTION_CLOSED_AFTER_HOURS", 24))
+# כל מסלול (גם עם משלוחים שלא הושלמו) עובר לארכיון אחרי X ימים
+RETENTION_MAX_AGE_DAYS = float(os.environ.get("RETENTION_MAX_AGE_DAYS", 14))
+# כל כמה שניות webhook_server מריץ ארכוב ברקע (0 = לא מריץ)
+RETENTION_INTERVAL_SECONDS = float(os.environ.get("RETENTION_INTERVAL_SECONDS", 3600))
+RETENTION_VACUUM = os.environ.get("RETENTION_VACUUM", "0") == "1"
+
+_ID_TIME_FORMAT = "%Y%m%d-%H%M%S"
+
+
+# ========= קבצי הארכיון =========
+
+def batch_day(batch_id: str) -> str:
+    # ROUTE-YYYYMMDD-HHMMSS -> YYYYMMDD
+    return batch_id[len("ROUTE-"):len("ROUTE-") + 8]
+
+
+def partition_path(day: str, archive_dir: Optional[str] = None) -> str:
+    """
+    קובץ אחד לכל יום: archive/YYYY/MM/YYYYMMDD.jsonl.gz, שורה (JSON) לכל מסלול.
+    """
+    return os.path.join(archive_dir or ARCHIVE_DIR, day[:4], day[4:6], f"{day}.jsonl.gz")
+
+
+def _append_batch(batch_id: str, batch: Dict[str, Any], archive_dir: Optional[str] = None) -> str:
+    day = batch_day(batch_id)
+    path = partition_path(day, archive_dir)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    line = json.dumps({"batch_id": batch_id, "batch": batch}, ensure_ascii=False) + "\n"
+    # כל הוספה היא gzip member נפרד בסוף הקובץ - gzip קורא קובץ כזה כרצף אחד, ואין צורך לכתוב מחדש את מה שכבר שם
+    with open(path, "ab") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+            gz.write(line.encode("utf8"))
+        raw.flush()
+        os.fsync(raw.fileno())
+    return day
+
+
+def _read_partition(path: str) -> Dict[str, Dict[str, Any]]:
+    # אם ארכוב נקטע אחרי הכתיבה לקובץ ולפני המחיקה מה-DB, המסלול יופיע פעמיים - הגרסה האחרונה קובעת
+    batches: Dict[str, Dict[str, Any]] = {}
+    try:
+        with gzip.open(path, "rt", encoding="utf8") as f:
+            for line in f:
+                if line.strip():
+                    record = json.loads(line)
+                    batches[record["batch_id"]] = record["batch"]
+    except FileNotFoundError:
+        pass
+    except (OSError, EOFError, ValueError) as e:
+        # זנב חתוך (כיבוי באמצע כתיבה) - מה שנקרא עד אליו תקין
+        print(f"❌ שגיאה בקריאת קובץ הארכיון {path}:", e)
+    return batches
+
+
+def archived_days(archive_dir: Optional[str] = None) -> List[str]:
+    days = []
+    for root, _, files in os.walk(archive_dir or ARCHIVE_DIR):
+        days.extend(name[:8] for name in files if name.endswith(".jsonl.gz"))
+    return sorted(days)
+
+
+# ========= ארכוב =========
+
+def run_retention(now: Optional[datetime] = None,
+                  closed_after_hours: float = RETENTION_CLOSED_AFTER_HOURS,
+                  max_age_days: float = RETENTION_MAX_AGE_DAYS,
+                  dry_run: bool = False,
+                  vacuum: bool = RETENTION_VACUUM,
+                  archive_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    מעביר לארכיון מסלולים סגורים שעבר זמנם ומסלולים ישנים מדי, כך שב-DB נשארים רק המסלולים הפעילים.
+    בטוח להרצה מכמה processes במקביל: כל מסלול מועבר בטרנזקציה שלו, ומסלול שכבר הועבר פשוט מדולג.
+    """
+    now = now or datetime.now()
+    closed_before = (now - timedelta(hours=closed_after_hours)).strftime(_ID_TIME_FORMAT)
+    expired_before = (now - timedelta(days=max_age_days)).strftime(_ID_TIME_FORMAT)
+    candidates = store.retention_candidates(closed_before, expired_before)
+    if dry_run:
+        return {"archived": 0, "candidates": candidates}
+
+    archived, deliveries = [], 0
+
+    def write(batch_id: str, batch: Dict[str, Any]) -> str:
+        nonlocal deliveries
+        deliveries += len(batch["deliveries"])
+        return _append_batch(batch_id, batch, archive_dir)
+
+    for batch_id in candidates:
+        if store.archive_batch(batch_id, write):
+            archived.append(batch_id)
+    if archived:
+        store.compact(vacuum=vacuum)
+    return {"archived": len(archived), "deliveries": deliveries, "batch_ids": archived}
+
+
+def compact_partition(day: str, archive_dir: Optional[str] = None) -> int:
+    """
+    כותב מחדש קובץ יומי כ-gzip אחד בלי כפילויות (דחיסה טובה יותר מהרבה members קטנים).
+    להריץ כשהארכוב לא רץ במקביל, למשל מה-CLI בשעות שקטות. מחזיר כמה מסלולים בקובץ.
+    """
+    path = partition_path(day, archive_dir)
+    batches = _read_partition(path)
+    if not batches:
+        return 0
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as gz:
+            for batch_id in sorted(batches):
+                record = {"batch_id": batch_id, "batch": batches[batch_id]}
+                gz.write((json.dumps(record, ensure_ascii=False) + "\n").encode("utf8"))
+        raw.flush()
+        os.fsync(raw.fileno())
+    os.replace(tmp_path, path)
+    return len(batches)
+
+
+# ========= שאילתות על הארכיון =========
+
+def load_archived_day(day: str, archive_dir: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    כל המסלולים שנוצרו ביום מסוים (YYYYMMDD), במבנה של store.get_batch.
+    """
+    return _read_partition(partition_path(day, archive_dir))
+
+
+def find_archived_deliveries(phone: str, archive_dir: Optional[str] = None) -> List[Tuple[str, int, Dict[str, Any]]]:
+    """
+    המשלוחים של טלפון נמען בארכיון, מהחדש לישן, כרשימת (batch_id, idx, delivery).
+    האינדקס ב-DB אומר באילו קבצים יומיים לחפש, כך שלא קוראים את כל הארכיון.
+    """
+    locations = store.find_archived(phone)
+    days: Dict[str, Dict[str, Dict[str, Any]]] = {}
+    results = []
+    for day, batch_id, idx in locations:
+        if day not in days:
+            days[day] = load_archived_day(day, archive_dir)
+        batch = days[day].get(batch_id)
+        if batch and idx < len(batch["deliveries"]):
+            results.append((batch_id, idx, batch["deliveries"][idx]))
+    return results
+
+
+def iter_archive(date_from: str, date_to: str, phone: Optional[str] = None,
+                 dispatcher_phone: Optional[str] = None,
+                 archive_dir: Optional[str] = None) -> Iterator[Tuple[str, int, Dict[str, Any]]]:
+    """
+    כל המשלוחים בארכיון בטווח תאריכים (YYYYMMDD, כולל), אופציונלית רק של טלפון נמען / שליח מסוים.
+    """
+    phone_key = normalize_phone(phone) if phone else None
+    dispatcher_key = normalize_phone(dispatcher_phone) if dispatcher_phone else None
+    for day in archived_days(archive_dir):
+        if day < date_from or day > date_to:
+            continue
+        for batch_id, batch in sorted(load_archived_day(day, archive_dir).items()):
+            if dispatcher_key and batch.get("dispatcher_phone") != dispatcher_key:
+                continue
+            for idx, delivery in enumerate(batch["deliveries"]):
+                if phone_key and normalize_phone(delivery.get("recipient_phone") or "") != phone_key:
+                    continue
+                yield batch_id, idx, delivery
+
+
+if __name__ == "__main__":
+    # שימוש:
+    #   python retention.py run [--dry-run] [--vacuum]
+    #   python retention.py find <phone>
+    #   python retention.py day <YYYYMMDD> [YYYYMMDD]
+    #   python retention.py compact [YYYYMMDD ...]
+    args = sys.argv[1:]
+    command = args[0] if args else ""
+    if command == "run":
+        result = run_retention(dry_run="--dry-run" in args, vacuum="--vacuum" in args or RETENTION_VACUUM)
+        if "--dry-run" in args:
+            print(f"{len(result['candidates'])} מסלולים יועברו לארכיון:", ", ".join(result["candidates"]))
+        else:
+            print(f"✅ הועברו לארכיון {result['archived']} מסלולים ({result['deliveries']} משלוחים)")
+    elif command == "find" and len(args) == 2:
+        for batch_id, idx, delivery in find_archived_deliveries(args[1]):
+            print(json.dumps({"batch_id": batch_id, "idx": idx, **delivery}, ensure_ascii=False))
+    elif command == "day" and len(args) in (2, 3):
+        for batch_id, idx, delivery in iter_archive(args[1], args[-1]):
+            print(json.dumps({"batch_id": batch_id, "idx": idx, **delivery}, ensure_ascii=False))
+    elif command == "compact":
+        for day in args[1:] or archived_days():
+            print(f"{day}: {compact_partition(day)} מסלולים")
+    else:
+        print("usage: python retention.py run [--dry-run] [--vacuum] | find <phone> | day <from> [to] | compact [day ...]")
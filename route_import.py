@@ -0,0 +1,145 @@
+import csv
+import io
+from typing import Dict, Any, Iterable, Iterator, Optional, AbstractSet
+
+import pandas as pd
+
+from phones import normalize_phones
+
+# ========= הגדרות =========
+
+# שמות עמודות מקובלים בקובץ (אותיות קטנות, בלי רווחים מסביב)
+COLUMN_ALIASES = {
+    "seq": ("seq", "sequence", "sequence_number", "מס'", "מס", "מספר סידורי", "סידורי"),
+    "name": ("name", "recipient_name", "שם", "שם הנמען", "שם לקוח", "נמען"),
+    "phone": ("phone", "recipient_phone", "טלפון", "מספר טלפון", "נייד"),
+    "address": ("address", "כתובת"),
+}
+
+DEFAULT_NAME = "לקוח"
+
+
+# ========= קריאת הקובץ (שורה אחרי שורה) =========
+
+def _iter_csv_rows(data: bytes) -> Iterator[list]:
+    # utf-8-sig: קבצים שיוצאו מאקסל מתחילים ב-BOM
+    text = io.TextIOWrapper(io.BytesIO(data), encoding="utf-8-sig", newline="")
+    sample = text.read(4096)
+    text.seek(0)
+    try:
+        dialect = csv.Sniffer().sniff(sample, delimiters=",;\t")
+    except csv.Error:
+        dialect = csv.excel
+    yield from csv.reader(text, dialect)
+
+
+def _iter_xlsx_rows(data: bytes) -> Iterator[list]:
+    try:
+        from openpyxl import load_workbook
+    except ImportError:
+        raise ValueError("ייבוא קבצי Excel דורש את החבילה openpyxl")
+    # read_only: השורות נקראות מה-XML תוך כדי, בלי לטעון את כל הגיליון לזיכרון
+    workbook = load_workbook(io.BytesIO(data), read_only=True, data_only=True)
+    try:
+        for row in workbook.active.iter_rows(values_only=True):
+            yield list(row)
+    finally:
+        workbook.close()
+
+
+def iter_rows(data: bytes, filename: str) -> Iterator[list]:
+    if filename.lower().endswith((".xlsx", ".xlsm")):
+        return _iter_xlsx_rows(data)
+    return _iter_csv_rows(data)
+
+
+def _map_columns(header: list) -> Dict[str, int]:
+    normalized = [str(h).strip().lower() if h is not None else "" for h in header]
+    mapping = {}
+    for field, aliases in COLUMN_ALIASES.items():
+        for i, name in enumerate(normalized):
+            if name in aliases:
+                mapping[field] = i
+                break
+    if "phone" not in mapping:
+        raise ValueError("לא נמצאה עמודת טלפון בקובץ (phone / טלפון)")
+    return mapping
+
+
+def _cell_text(value) -> str:
+    if value is None:
+        return ""
+    # אקסל שומר טלפון כמספר (507676706.0)
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+# ========= בדיקה =========
+
+def import_route_file(data: bytes, filename: str, existing_phones: Iterable[str] = (),
+                      allowed_numbers: Optional[AbstractSet[str]] = None, first_seq: int = 1) -> Dict[str, Any]:
+    """
+    קורא מניפסט משלוחים (CSV / XLSX) ומחזיר {"items": שורות תקינות במבנה של temp_route_list,
+    "errors": [{"row", "phone", "error"}]}. מספרי השורות הם כמו בקובץ (הכותרת היא שורה 1).
+    """
+    rows = iter_rows(data, filename)
+    header = next(rows, None)
+    if header is None:
+        return {"items": [], "errors": []}
+    columns = _map_columns(header)
+
+    row_numbers, raw = [], {field: [] for field in COLUMN_ALIASES}
+    for row_number, row in enumerate(rows, start=2):
+        if not any(_cell_text(v) for v in row):
+            continue
+        row_numbers.append(row_number)
+        for field in COLUMN_ALIASES:
+            i = columns.get(field)
+            raw[field].append(_cell_text(row[i]) if i is not None and i < len(row) else "")
+
+    if not row_numbers:
+        return {"items": [], "errors": []}
+
+    df = pd.DataFrame(raw)
+    df["row"] = row_numbers
+    df["phone_norm"] = normalize_phones(df["phone"]).values
+
+    df["error"] = ""
+    missing = df["phone"] == ""
+    df.loc[missing, "error"] = "חסר מספר טלפון"
+    invalid = ~missing & ~df["phone_norm"].str.fullmatch(r"972\d{8,9}")
+    df.loc[invalid, "error"] = "מספר טלפון לא תקין"
+    if allowed_numbers is not None:
+        not_allowed = (df["error"] == "") & ~df["phone_norm"].isin(allowed_numbers)
+        df.loc[not_allowed, "error"] = "המספר לא ברשימת המספרים המורשים"
+    seq = pd.to_numeric(df["seq"], errors="coerce")
+    bad_seq = (df["error"] == "") & (df["seq"] != "") & ~(seq >= 1)
+    df.loc[bad_seq, "error"] = "מספר סידורי לא תקין"
+
+    existing = (df["error"] == "") & df["phone_norm"].isin(set(existing_phones))
+    df.loc[existing, "error"] = "המספר כבר ברשימה"
+    # כפילות נבדקת רק מול שורות תקינות: אם העותק הראשון נפסל, השני הוא זה שנכנס
+    ok = df["error"] == ""
+    duplicate = ok & df["phone_norm"].where(ok).duplicated()
+    first_row = df[df["error"] == ""].drop_duplicates("phone_norm").set_index("phone_norm")["row"]
+    df.loc[duplicate, "error"] = "מופיע כבר בשורה " + df.loc[duplicate, "phone_norm"].map(first_row).astype(str)
+
+    valid = df[df["error"] == ""].copy()
+    # שורות בלי מספר סידורי מקבלות מספרים רצים אחרי הגבוה שבקובץ
+    given = pd.to_numeric(valid["seq"], errors="coerce").astype(float)
+    next_seq = max(first_seq, int(given.max()) + 1 if given.notna().any() else first_seq)
+    blank = given.isna()
+    given[blank] = list(range(next_seq, next_seq + int(blank.sum())))
+    valid["seq"] = given.astype(int)
+    valid = valid.sort_values(["seq", "row"], kind="stable")
+
+    items = [
+        {"seq": seq, "name": name or DEFAULT_NAME, "phone": phone, "address": address}
+        for seq, name, phone, address in zip(valid["seq"].tolist(), valid["name"], valid["phone_norm"], valid["address"])
+    ]
+    errors = [
+        {"row": row, "phone": phone, "error": error}
+        for row, phone, error in zip(df["row"].tolist(), df["phone"], df["error"]) if error
+    ]
+    return {"items": items, "errors": errors}
@@ -0,0 +1,260 @@
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+import requests
+
+from ai_cache import atomic_write_json
+from eta import ETA_SERVICE_MINUTES
+
+# ========= הגדרות =========
+
+GEOCODER = os.environ.get("GEOCODER", "nominatim")  # nominatim | none (רק מהקאש - עבודה בלי רשת)
+GEOCODE_CACHE_FILE = os.environ.get("GEOCODE_CACHE_FILE", "geocode_cache.json")
+NOMINATIM_URL = os.environ.get("NOMINATIM_URL", "https://nominatim.openstreetmap.org/search")
+NOMINATIM_USER_AGENT = os.environ.get("NOMINATIM_USER_AGENT", "buzz-lite-route-planner")
+GEOCODE_COUNTRY = os.environ.get("GEOCODE_COUNTRY", "il")
+# מהירות נסיעה ממוצעת בעיר, להמרת מרחק לדקות בחלונות הזמן
+ROUTE_SPEED_KMH = float(os.environ.get("ROUTE_SPEED_KMH", 25))
+ROUTE_TWO_OPT_PASSES = int(os.environ.get("ROUTE_TWO_OPT_PASSES", 50))
+
+EARTH_RADIUS_KM = 6371.0
+
+Coords = Tuple[float, float]
+
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_address(address: str) -> str:
+    return _WS_RE.sub(" ", str(address).strip().lower()).strip(" ,.")
+
+
+# ========= גיאוקודינג =========
+
+class NominatimGeocoder:
+    """
+    ספק גיאוקודינג של OpenStreetMap. מוגבל לבקשה אחת בשנייה (תנאי השימוש של השירות).
+    """
+
+    def __init__(self, url: str = NOMINATIM_URL, country: str = GEOCODE_COUNTRY,
+                 user_agent: str = NOMINATIM_USER_AGENT, min_interval: float = 1.0):
+        self.url = url
+        self.country = country
+        self.min_interval = min_interval
+        self._session = requests.Session()
+        self._session.headers["User-Agent"] = user_agent
+        self._last_call = 0.0
+        self._lock = threading.Lock()
+
+    def geocode(self, address: str) -> Optional[Coords]:
+        """
+        מחזיר (lat, lon), או None אם הכתובת לא נמצאה. שגיאת רשת נזרקת הלאה (כדי שלא תישמר בקאש).
+        """
+        with self._lock:
+            wait = self._last_call + self.min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            self._last_call = time.monotonic()
+        params = {"q": address, "format": "json", "limit": 1}
+        if self.country:
+            params["countrycodes"] = self.country
+        resp = self._session.get(self.url, params=params, timeout=10)
+        resp.raise_for_status()
+        results = resp.json()
+        if not results:
+            return None
+        return float(results[0]["lat"]), float(results[0]["lon"])
+
+
+class CachedGeocoder:
+    """
+    קאש קבוע בדיסק מעל ספק גיאוקודינג כלשהו (כל אובייקט עם geocode(address)).
+    כתובת שכבר חושבה לא יוצאת שוב לרשת, וכשאין ספק (GEOCODER=none) השלב עובד רק מהקאש.
+    """
+
+    def __init__(self, provider=None, path: str = GEOCODE_CACHE_FILE):
+        self.provider = provider
+        self.path = path
+        self._entries: Dict[str, Optional[list]] = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        if path:
+            self.load()
+
+    def geocode(self, address: str) -> Optional[Coords]:
+        key = normalize_address(address)
+        if not key:
+            return None
+        with self._lock:
+            if key in self._entries:
+                cached = self._entries[key]
+                return tuple(cached) if cached else None
+        if self.provider is None:
+            return None
+        try:
+            coords = self.provider.geocode(address)
+        except (requests.RequestException, ValueError, KeyError) as e:
+            print("❌ שגיאה בגיאוקודינג:", address, e)
+            return None
+        with self._lock:
+            # גם "לא נמצא" נשמר, כדי לא לשאול שוב על אותה כתובת
+            self._entries[key] = list(coords) if coords else None
+            self._dirty = True
+        return coords
+
+    def geocode_many(self, addresses: List[str]) -> List[Optional[Coords]]:
+        return [self.geocode(a) if a else None for a in addresses]
+
+    def save(self):
+        if not self.path or not self._dirty:
+            return
+        with self._lock:
+            entries = dict(self._entries)
+            self._dirty = False
+        try:
+            atomic_write_json(self.path, entries)
+        except OSError as e:
+            print("❌ שגיאה בשמירת קאש הכתובות:", e)
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf8") as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print("❌ שגיאה בטעינת קאש הכתובות:", e)
+            return
+        with self._lock:
+            self._entries.update(entries)
+
+
+def create_geocoder(backend: str = GEOCODER) -> CachedGeocoder:
+    if backend == "nominatim":
+        return CachedGeocoder(NominatimGeocoder())
+    if backend == "none":
+        return CachedGeocoder(None)
+    raise ValueError(f"Unknown GEOCODER: {backend}")
+
+
+# ========= סידור המסלול =========
+
+def distance_matrix(coords: np.ndarray) -> np.ndarray:
+    """
+    מטריצת מרחקים (ק"מ, haversine) בין כל זוג נקודות. coords הוא מערך (n, 2) של lat, lon במעלות.
+    """
+    lat = np.radians(coords[:, 0])[:, None]
+    lon = np.radians(coords[:, 1])[:, None]
+    dlat = lat - lat.T
+    dlon = lon - lon.T
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat) * np.cos(lat.T) * np.sin(dlon / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+def _nearest_neighbour(dist: np.ndarray, start: int) -> np.ndarray:
+    n = len(dist)
+    order = np.empty(n, dtype=np.int64)
+    visited = np.zeros(n, dtype=bool)
+    current = start
+    for k in range(n):
+        order[k] = current
+        visited[current] = True
+        if k == n - 1:
+            break
+        row = np.where(visited, np.inf, dist[current])
+        current = int(np.argmin(row))
+    return order
+
+
+def _two_opt(route: np.ndarray, dist: np.ndarray, fixed_start: bool, max_passes: int) -> np.ndarray:
+    """
+    שיפור 2-opt למסלול פתוח (בלי חזרה להתחלה): הופך קטע route[i..j] כשזה מקצר את הדרך.
+    לכל i כל ה-j האפשריים נבדקים יחד ב-numpy.
+    """
+    route = route.copy()
+    n = len(route)
+    first = 1 if fixed_start else 0
+    for _ in range(max_passes):
+        improved = False
+        for i in range(first, n - 1):
+            js = np.arange(i + 1, n)
+            b = route[i]
+            c = route[js]
+            has_next = js < n - 1
+            d = route[np.minimum(js + 1, n - 1)]
+            before = np.where(has_next, dist[c, d], 0.0)
+            after = np.where(has_next, dist[b, d], 0.0)
+            if i > 0:
+                a = route[i - 1]
+                before = before + dist[a, b]
+                after = after + dist[a, c]
+            delta = after - before
+            k = int(np.argmin(delta))
+            if delta[k] < -1e-9:
+                route[i:js[k] + 1] = route[i:js[k] + 1][::-1]
+                improved = True
+        if not improved:
+            break
+    return route
+
+
+def optimize_order(coords: List[Coords], start: Optional[Coords] = None,
+                   max_passes: int = ROUTE_TWO_OPT_PASSES) -> Tuple[List[int], List[float]]:
+    """
+    סדר ביקור קרוב לאופטימלי: nearest-neighbour ואחריו 2-opt.
+    start - נקודת היציאה של השליח (אם ידועה). בלעדיה המסלול מתחיל מהעצירה הראשונה ברשימה.
+    מחזיר (אינדקסים לפי סדר הביקור, מרחק בק"מ מהנקודה הקודמת לכל עצירה).
+    """
+    n = len(coords)
+    if n == 0:
+        return [], []
+    points = np.asarray(([start] if start else []) + list(coords), dtype=np.float64)
+    dist = distance_matrix(points)
+    route = _two_opt(_nearest_neighbour(dist, 0), dist, fixed_start=start is not None, max_passes=max_passes)
+
+    legs = np.zeros(len(route))
+    legs[1:] = dist[route[:-1], route[1:]]
+    if start:
+        return (route[1:] - 1).tolist(), legs[1:].tolist()
+    return route.tolist(), legs.tolist()
+
+
+def plan_route(stops: List[Dict[str, Any]], geocoder, start_address: Optional[str] = None,
+               speed_kmh: float = ROUTE_SPEED_KMH,
+               service_minutes: float = ETA_SERVICE_MINUTES) -> Dict[str, Any]:
+    """
+    מסדר את עצירות המסלול לפי הכתובות (שדה "address").
+    מחזיר {"stops": העצירות בסדר החדש עם seq ו-leg_minutes, "unresolved": כתובות שלא נמצאו,
+    "distance_km": אורך המסלול}. עצירות בלי מיקום נשארות בסוף, לפי הסדר המקורי.
+    """
+    stops = sorted(stops, key=lambda s: s.get("seq") or 0)
+    coords = geocoder.geocode_many([s.get("address") for s in stops])
+    start = geocoder.geocode(start_address) if start_address else None
+    if hasattr(geocoder, "save"):
+        geocoder.save()
+
+    located = [i for i, c in enumerate(coords) if c is not None]
+    unresolved = [i for i, c in enumerate(coords) if c is None]
+    order, legs_km = optimize_order([coords[i] for i in located], start)
+
+    ordered = []
+    for k, leg_km in zip(order, legs_km):
+        stop = dict(stops[located[k]])
+        stop["leg_minutes"] = round(leg_km / speed_kmh * 60 + service_minutes, 1)
+        ordered.append(stop)
+    for i in unresolved:
+        stop = dict(stops[i])
+        stop["leg_minutes"] = service_minutes
+        ordered.append(stop)
+    for seq, stop in enumerate(ordered, start=1):
+        stop["seq"] = seq
+
+    return {
+        "stops": ordered,
+        "unresolved": [stops[i].get("address") or stops[i].get("name") for i in unresolved],
+        "distance_km": round(float(sum(legs_km)), 2),
+    }
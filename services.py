@@ -1,139 +1,425 @@
+import asyncio
 import json
+import random
+import textwrap
+import threading
+import time
+import httpx
 import requests
-from openai import OpenAI
-from typing import Dict, Any, List
-from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from openai import OpenAI, AsyncOpenAI
+from typing import Dict, Any, List, Optional, Tuple, Callable
+from datetime import datetime
 import os 
 
+try:
+    import tiktoken
+except ImportError:  # אופציונלי - בלעדיו ספירת הטוקנים היא הערכה
+    tiktoken = None
+
+import store
+from ai_cache import ai_cache, AI_CACHE_DETERMINISTIC
+from eta import compute_route_windows
+from phones import normalize_phone
+from metrics import ai_requests, green_api_requests, log_event, reply_source
+
 # ========= הגדרות כלליות =========
 
-DATA_FILE = "data.json"
+DATA_FILE = store.LEGACY_JSON_FILE
 
 OPENAI_KEY = os.environ.get("OPENAI_KEY", "DEFAULT_OPENAI_KEY_IF_MISSING")
+# ריק = השרת של OpenAI. בבדיקות עומס מפנים לשרת דמה מקומי (benchmarks/stub_servers.py)
+OPENAI_BASE_URL = os.environ.get("OPENAI_BASE_URL") or None
 GREEN_INSTANCE = os.environ.get("GREEN_INSTANCE", "DEFAULT_GREEN_INSTANCE_IF_MISSING")
 GREEN_TOKEN = os.environ.get("GREEN_TOKEN", "DEFAULT_GREEN_TOKEN_IF_MISSING")
+GREEN_API_URL = os.environ.get("GREEN_API_URL", "https://api.green-api.com")
+
+AI_MODEL = "gpt-4o-mini"
+AI_TIMEOUT = float(os.environ.get("AI_TIMEOUT", 30))
+# תקציב טוקנים: כמה טוקנים מותר להודעת לקוח אחת (מעבר לזה היא נחתכת) וכמה לתשובה
+AI_MAX_MESSAGE_TOKENS = int(os.environ.get("AI_MAX_MESSAGE_TOKENS", 300))
+AI_MAX_COMPLETION_TOKENS = int(os.environ.get("AI_MAX_COMPLETION_TOKENS", 300))
+GREEN_TIMEOUT = float(os.environ.get("GREEN_TIMEOUT", 10))
+
+# מגבלות מקביליות לגרסאות ה-async (לכל process)
+AI_CONCURRENCY = int(os.environ.get("AI_CONCURRENCY", 100))
+GREEN_CONCURRENCY = int(os.environ.get("GREEN_CONCURRENCY", 50))
+HTTP_MAX_CONNECTIONS = int(os.environ.get("HTTP_MAX_CONNECTIONS", 200))
+HTTP_MAX_KEEPALIVE = int(os.environ.get("HTTP_MAX_KEEPALIVE", 50))
+
+# שליחה מרוכזת (יצירת מסלול): קצב מותאם למכסות של Green API
+GREEN_RATE_PER_SECOND = float(os.environ.get("GREEN_RATE_PER_SECOND", 5))
+GREEN_RATE_BURST = int(os.environ.get("GREEN_RATE_BURST", 5))
+BULK_SEND_WORKERS = int(os.environ.get("BULK_SEND_WORKERS", 8))
+BULK_SEND_RETRIES = int(os.environ.get("BULK_SEND_RETRIES", 3))
+BULK_SEND_BACKOFF = float(os.environ.get("BULK_SEND_BACKOFF", 1.0))
 
 
 # ========= פונקציות עזר =========
 
 def load_data() -> Dict[str, Dict[str, Any]]:
     """
-    טוען את הנתונים מהקובץ. מבטיח החזרה של מילון (dict).
+    טוען את כל הנתונים מה-DB (store.py) במבנה הישן של data.json. מבטיח החזרה של מילון (dict).
+    לקריאה של משלוח או מסלול בודד עדיף להשתמש ישירות ב-store.
     """
     try:
-        with open(DATA_FILE, "r", encoding="utf8") as f:
-            data = json.load(f)
-            # בדיקה קריטית: אם הנתונים הם רשימה (מגרסה ישנה), נחזיר מילון ריק או נמיר
-            if isinstance(data, list):
-                return {} 
-            return data if isinstance(data, dict) else {}
-    except (FileNotFoundError, json.JSONDecodeError):
+        return store.load_all()
+    except Exception as e:
+        print("❌ שגיאה בטעינת הנתונים:", e)
         return {}
 
 
 def save_data(data: Dict[str, Dict[str, Any]]):
     try:
-        with open(DATA_FILE, "w", encoding="utf8") as f:
-            json.dump(data, f, ensure_ascii=False, indent=2)
+        store.save_all(data)
     except Exception as e:
-        print("❌ שגיאה בשמירת data.json:", e)
-
-
-def normalize_phone(phone: str) -> str:
-    phone = str(phone).strip().replace("-", "").replace(" ", "").replace("+", "")
-    phone = phone.lstrip("0")
-    if not phone.startswith("972"):
-        phone = "972" + phone
-    return phone
+        print("❌ שגיאה בשמירת הנתונים:", e)
 
 
 def calculate_time_range(position: int, start_time: datetime = None) -> str:
-    if start_time is None:
-        start_time = datetime.now()
-    
-    base_delay = 30
-    per_delivery = 5
-    
-    start_delay = base_delay + (position * per_delivery)
-    end_delay = start_delay + 120 
-    
-    arrival_min = start_time + timedelta(minutes=start_delay)
-    arrival_max = start_time + timedelta(minutes=end_delay)
-    
-    time_format = "%H:%M"
-    return f"{arrival_min.strftime(time_format)}-{arrival_max.strftime(time_format)}"
+    """
+    חלון זמן לעצירה בודדת. ליצירת מסלול שלם עדיף eta.compute_route_windows - מחשב את כל העצירות בבת אחת.
+    """
+    return compute_route_windows(1, start_time, start_position=position)[0]
 
 
-def send_whatsapp_message(phone: str, message: str):
+def _green_send_request(phone: str, message: str):
     phone = normalize_phone(phone)
-    url = f"https://api.green-api.com/waInstance{GREEN_INSTANCE}/sendMessage/{GREEN_TOKEN}"
+    url = f"{GREEN_API_URL}/waInstance{GREEN_INSTANCE}/sendMessage/{GREEN_TOKEN}"
     chat_id = phone + "@c.us"
-    payload = {"chatId": chat_id, "message": message}
+    return url, {"chatId": chat_id, "message": message}
+
+
+def send_whatsapp_message(phone: str, message: str):
+    url, payload = _green_send_request(phone, message)
     
     try:
-        resp = requests.post(url, json=payload, timeout=10)
+        resp = requests.post(url, json=payload, timeout=GREEN_TIMEOUT)
         return resp.status_code == 200
     except Exception as e:
         print("❌ שגיאה בשליחה:", e)
         return False
 
 
-# ========= AI – ניתוח ושיחה (טבעי וזורם) =========
+# ========= שליחה מרוכזת (app.py) =========
 
-def analyze_text_with_ai(text: str, current_state: dict) -> dict:
+class TokenBucket:
     """
-    מנתח את הטקסט ומחזיר תשובה טבעית ואנושית.
+    מגביל קצב thread-safe: עד burst בקשות מיידיות, ואחר כך rate בקשות לשנייה.
+    """
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def _send_with_retry(session: requests.Session, bucket: TokenBucket, phone: str, message: str,
+                     retries: int, backoff: float) -> Dict[str, Any]:
+    url, payload = _green_send_request(phone, message)
+    result = {"phone": phone, "ok": False, "attempts": 0, "error": None}
+    
+    for attempt in range(1, retries + 2):
+        bucket.acquire()
+        result["attempts"] = attempt
+        try:
+            resp = session.post(url, json=payload, timeout=GREEN_TIMEOUT)
+            if resp.status_code == 200:
+                result["ok"], result["error"] = True, None
+                return result
+            result["error"] = f"HTTP {resp.status_code}"
+            # שגיאות לקוח (מלבד 429) לא יסתדרו בניסיון נוסף
+            if 400 <= resp.status_code < 500 and resp.status_code != 429:
+                return result
+        except requests.RequestException as e:
+            result["error"] = str(e)
+        if attempt <= retries:
+            time.sleep(backoff * (2 ** (attempt - 1)) * random.uniform(0.5, 1.5))
+    return result
+
+
+def send_whatsapp_bulk(messages: List[Tuple[str, str]],
+                       rate_per_second: float = None,
+                       burst: int = None,
+                       max_workers: int = None,
+                       retries: int = None,
+                       backoff: float = None,
+                       progress_callback: Callable[[int, int], None] = None) -> List[Dict[str, Any]]:
     """
-    client = OpenAI(api_key=OPENAI_KEY)
+    שולח הרבה הודעות (phone, message) במקביל, עם הגבלת קצב, ניסיונות חוזרים ו-backoff.
+    מחזיר תוצאה לכל נמען ({"phone", "ok", "attempts", "error"}) באותו סדר של הקלט.
+    progress_callback(done, total) נקרא מה-thread שקרא לפונקציה (בטוח ל-Streamlit).
+    """
+    rate = rate_per_second if rate_per_second is not None else GREEN_RATE_PER_SECOND
+    bucket = TokenBucket(rate, burst if burst is not None else GREEN_RATE_BURST)
+    workers = max_workers or BULK_SEND_WORKERS
+    retries = BULK_SEND_RETRIES if retries is None else retries
+    backoff = BULK_SEND_BACKOFF if backoff is None else backoff
+    
+    results: List[Optional[Dict[str, Any]]] = [None] * len(messages)
+    session = requests.Session()
+    session.mount("https://", requests.adapters.HTTPAdapter(pool_maxsize=workers))
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=workers))
     
-    state_desc = json.dumps(current_state, ensure_ascii=False)
+    with session, ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = {
+            pool.submit(_send_with_retry, session, bucket, phone, message, retries, backoff): i
+            for i, (phone, message) in enumerate(messages)
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            i = futures[future]
+            try:
+                results[i] = future.result()
+            except Exception as e:
+                results[i] = {"phone": messages[i][0], "ok": False, "attempts": 0, "error": str(e)}
+            if progress_callback:
+                progress_callback(done, len(messages))
     
-    system_prompt = f"""
+    failed = [r for r in results if not r["ok"]]
+    if failed:
+        print(f"❌ {len(failed)} מתוך {len(results)} הודעות לא נשלחו")
+    return results
+
+
+# ========= לקוחות async משותפים (ל-webhook_server) =========
+
+_http_client: Optional[httpx.AsyncClient] = None
+_async_openai: Optional[AsyncOpenAI] = None
+_ai_semaphore: Optional[asyncio.Semaphore] = None
+_green_semaphore: Optional[asyncio.Semaphore] = None
+
+
+async def init_async_clients():
+    """
+    יוצר פעם אחת (ב-lifespan של האפליקציה) לקוח HTTP עם connection pool ולקוח AsyncOpenAI שמשתמש בו.
+    """
+    global _http_client, _async_openai, _ai_semaphore, _green_semaphore
+    if _http_client is not None:
+        return
+    _http_client = httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE),
+        timeout=httpx.Timeout(AI_TIMEOUT, connect=5),
+    )
+    _async_openai = AsyncOpenAI(api_key=OPENAI_KEY, base_url=OPENAI_BASE_URL, http_client=_http_client, max_retries=1)
+    _ai_semaphore = asyncio.Semaphore(AI_CONCURRENCY)
+    _green_semaphore = asyncio.Semaphore(GREEN_CONCURRENCY)
+
+
+async def close_async_clients():
+    global _http_client, _async_openai, _ai_semaphore, _green_semaphore
+    if _http_client is not None:
+        await _http_client.aclose()
+    _http_client = _async_openai = _ai_semaphore = _green_semaphore = None
+
+
+async def send_whatsapp_message_async(phone: str, message: str) -> bool:
+    await init_async_clients()
+    url, payload = _green_send_request(phone, message)
+    
+    try:
+        async with _green_semaphore:
+            resp = await _http_client.post(url, json=payload, timeout=GREEN_TIMEOUT)
+        ok = resp.status_code == 200
+        if not ok:
+            log_event("green_api_error", "error", phone=phone, status_code=resp.status_code)
+    except Exception as e:
+        log_event("green_api_error", "error", phone=phone, error=repr(e))
+        ok = False
+    green_api_requests.inc(result="ok" if ok else "error")
+    return ok
+
+
+# ========= AI – ניתוח ושיחה (טבעי וזורם) =========
+
+AI_FALLBACK_RESPONSE = {
+    "extracted_data": {},
+    "reply_message": "סליחה, לא הבנתי. תוכל לחזור על זה?"
+}
+
+_openai_client: Optional[OpenAI] = None
+
+
+def _get_openai_client() -> OpenAI:
+    global _openai_client
+    if _openai_client is None:
+        _openai_client = OpenAI(api_key=OPENAI_KEY, base_url=OPENAI_BASE_URL)
+    return _openai_client
+
+
+# ההנחיות הקבועות - זהות בכל קריאה, כך שה-prefix של הפרומפט נשמר בקאש אצל OpenAI.
+# כל מה שמשתנה (מצב המשלוח, הודעת הלקוח) נשלח בהודעות נפרדות אחריו.
+SYSTEM_PROMPT = textwrap.dedent("""
     אתה "בוט Buzz", שליח חכם, אדיב וקליל.
     המטרה שלך: לנהל שיחה נעימה עם הלקוח כדי להשיג את פרטי הגישה למשלוח.
-    
+
     הנחיות לתגובה (reply_message):
     1. **סגנון דיבור:** דבר בעברית טבעית, יומיומית וקצרה. תהיה נחמד אבל ענייני. מותר להשתמש באימוג'יז 📦😊.
     2. **זרימת השיחה:** - אם חסר מידע, תשאל עליו בצורה שמתאימה להקשר. אל תהיה רובוטי ("חסר שדה X").
        - תשאל שאלה אחת בכל פעם כדי לא להעמיס.
        - סדר עדיפות: קודם כל תברר אם בבית. אם לא - איפה להשאיר. אחר כך פרטים טכניים (דירה/קומה/קוד).
-    
+
     3. **חילוץ מידע:**
        - נסה להבין הקשר. אם הלקוח כותב "תשאיר בלובי", תבין מזה שצריך לעדכן את המיקום ל"לובי" ושלא צריך לשאול יותר שאלות.
        - אם הלקוח כותב "קומה 2 דירה 4", תחלץ את שניהם בבת אחת.
-    
+
     מבנה פלט JSON:
-    {{
-      "extracted_data": {{
+    {
+      "extracted_data": {
           "someone_home": "yes" | "no" | null,
           "drop_location": string | null,
           "apartment": string | null,
           "floor": string | null,
           "entrance_code": string | null
-      }},
+      },
       "reply_message": "ההודעה שלך ללקוח"
-    }}
-    
-    מצב נוכחי של הנתונים (מה שיש לנו כבר):
-    {state_desc}
+    }
+
+    אחרי ההנחיות תקבל את המצב הנוכחי של הנתונים (מה שיש לנו כבר). שדה שלא מופיע בו - עדיין חסר.
+""").strip()
+
+# מונים מצטברים לשימוש ב-AI (לכל process)
+ai_usage = {"calls": 0, "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0, "latency_ms": 0.0}
+
+_encoding = None
+
+
+def count_tokens(text: str) -> int:
+    """
+    סופר טוקנים עם tiktoken אם מותקן; אחרת הערכה גסה (עברית ≈ 2.5 תווים לטוקן).
     """
+    global _encoding
+    if tiktoken is not None:
+        if _encoding is None:
+            try:
+                _encoding = tiktoken.encoding_for_model(AI_MODEL)
+            except KeyError:
+                _encoding = tiktoken.get_encoding("o200k_base")
+        return len(_encoding.encode(text))
+    return max(1, int(len(text) / 2.5))
+
+
+def _truncate_to_budget(text: str, max_tokens: int) -> str:
+    if count_tokens(text) <= max_tokens:
+        return text
+    if tiktoken is not None:
+        return _encoding.decode(_encoding.encode(text)[:max_tokens])
+    return text[:int(max_tokens * 2.5)]
+
+
+def _build_ai_request(text: str, current_state: dict, temperature: float = 0.7) -> dict:
+    # רק שדות שכבר ידועים, ב-JSON בלי רווחים
+    known = {k: v for k, v in current_state.items() if v is not None}
+    state_desc = json.dumps(known, ensure_ascii=False, separators=(",", ":"))
     
+    text = _truncate_to_budget(text, AI_MAX_MESSAGE_TOKENS)
     user_content = f"""הודעת הלקוח: "{text}"\nתגיב בצורה טבעית."""
     
+    return dict(
+        model=AI_MODEL,
+        response_format={"type": "json_object"},
+        messages=[
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "system", "content": f"מצב נוכחי: {state_desc}"},
+            {"role": "user",  "content": user_content},
+        ],
+        temperature=temperature, # 0.7 = יצירתיות מאוזנת לשיחה טבעית
+        max_tokens=AI_MAX_COMPLETION_TOKENS,
+    )
+
+
+def _record_usage(resp, started: float):
+    latency_ms = (time.perf_counter() - started) * 1000
+    usage = getattr(resp, "usage", None)
+    prompt = getattr(usage, "prompt_tokens", 0) or 0
+    completion = getattr(usage, "completion_tokens", 0) or 0
+    details = getattr(usage, "prompt_tokens_details", None)
+    cached = getattr(details, "cached_tokens", 0) or 0
+    
+    ai_usage["calls"] += 1
+    ai_usage["prompt_tokens"] += prompt
+    ai_usage["completion_tokens"] += completion
+    ai_usage["cached_tokens"] += cached
+    ai_usage["latency_ms"] += latency_ms
+    log_event("ai_call", prompt_tokens=prompt, cached_tokens=cached, completion_tokens=completion,
+              latency_ms=round(latency_ms, 1))
+
+
+def _record_ai_error(error: Exception):
+    # גם תשובה שהגיעה אבל לא JSON תקין נספרת כשגיאה - הלקוח מקבל את תשובת ה-fallback
+    ai_requests.inc(result="error")
+    reply_source.inc(source="ai_fallback")
+    log_event("ai_error", "error", error=repr(error))
+
+
+def _cache_lookup(text: str, current_state: dict):
+    """
+    מחזיר (cache_key, תשובה שמורה, temperature). cache_key הוא None אם הבקשה לא נכנסת לקאש.
+    """
+    if ai_cache is None or not ai_cache.is_cacheable(text):
+        return None, None, 0.7
+    key = ai_cache.make_key(text, current_state)
+    return key, ai_cache.get(key), 0.0 if AI_CACHE_DETERMINISTIC else 0.7
+
+
+def analyze_text_with_ai(text: str, current_state: dict) -> dict:
+    """
+    מנתח את הטקסט ומחזיר תשובה טבעית ואנושית.
+    """
+    cache_key, cached, temperature = _cache_lookup(text, current_state)
+    if cached is not None:
+        reply_source.inc(source="ai_cache")
+        return cached
+    try:
+        started = time.perf_counter()
+        resp = _get_openai_client().chat.completions.create(
+            timeout=AI_TIMEOUT, **_build_ai_request(text, current_state, temperature))
+        _record_usage(resp, started)
+        result = json.loads(resp.choices[0].message.content)
+    except Exception as e:
+        _record_ai_error(e)
+        return dict(AI_FALLBACK_RESPONSE)
+    ai_requests.inc(result="ok")
+    reply_source.inc(source="ai")
+    if cache_key:
+        ai_cache.set(cache_key, result)
+    return result
+
+
+async def analyze_text_with_ai_async(text: str, current_state: dict) -> dict:
+    """
+    כמו analyze_text_with_ai, אבל עם הלקוח המשותף ובלי לחסום את ה-event loop.
+    """
+    cache_key, cached, temperature = _cache_lookup(text, current_state)
+    if cached is not None:
+        reply_source.inc(source="ai_cache")
+        return cached
+    await init_async_clients()
     try:
-        resp = client.chat.completions.create(
-            model="gpt-4o-mini",
-            response_format={"type": "json_object"},
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user",  "content": user_content},
-            ],
-            temperature=0.7, # יצירתיות מאוזנת לשיחה טבעית
-        )
-        return json.loads(resp.choices[0].message.content)
+        async with _ai_semaphore:
+            started = time.perf_counter()
+            resp = await _async_openai.chat.completions.create(
+                **_build_ai_request(text, current_state, temperature))
+        _record_usage(resp, started)
+        result = json.loads(resp.choices[0].message.content)
     except Exception as e:
-        print("❌ AI Error:", e)
-        return {
-            "extracted_data": {},
-            "reply_message": "סליחה, לא הבנתי. תוכל לחזור על זה?"
-        }
\ No newline at end of file
+        _record_ai_error(e)
+        return dict(AI_FALLBACK_RESPONSE)
+    ai_requests.inc(result="ok")
+    reply_source.inc(source="ai")
+    if cache_key:
+        ai_cache.set(cache_key, result)
+    return result
\ No newline at end of file
@@ -0,0 +1,512 @@
+import json
+import os
+import sqlite3
+import sys
+import threading
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple, Callable
+
+from phones import normalize_phone
+
+# ========= הגדרות =========
+
+DB_FILE = os.environ.get("DB_FILE", "data.db")
+LEGACY_JSON_FILE = os.environ.get("DATA_FILE", "data.json")
+AUTO_MIGRATE = os.environ.get("AUTO_MIGRATE_JSON", "1") == "1"
+
+DONE_STATUS = "מלא"
+# השליח סימן במסך "המסלול שלי" שהמשלוח נמסר
+DELIVERED_STATUS = "נמסר"
+# משלוחים בסטטוסים האלה לא "פעילים": לא מחפשים אותם ראשונים ב-webhook, ומסלול שכולו כזה נחשב סגור
+INACTIVE_STATUSES = (DONE_STATUS, DELIVERED_STATUS)
+
+_local = threading.local()
+
+
+def _phone_key(phone: Any) -> Optional[str]:
+    # המפתח לאינדקס: הטלפון בפורמט המנורמל (972...), מחושב פעם אחת בזמן הכתיבה
+    return normalize_phone(phone) if phone else None
+
+
+def _is_active(delivery: Dict[str, Any]) -> int:
+    return 0 if delivery.get("status") in INACTIVE_STATUSES else 1
+
+
+def _backfill_phone_index(conn: sqlite3.Connection):
+    rows = conn.execute("SELECT batch_id, idx, data FROM deliveries").fetchall()
+    updates = []
+    for row in rows:
+        d = json.loads(row["data"])
+        updates.append((_phone_key(d.get("recipient_phone")), _is_active(d), row["batch_id"], row["idx"]))
+    conn.executemany("UPDATE deliveries SET phone_key = ?, active = ? WHERE batch_id = ? AND idx = ?", updates)
+
+
+# כל שלב במערך הוא מיגרציית סכימה אחת (SQL או פונקציה). PRAGMA user_version שומר כמה שלבים כבר הורצו.
+_MIGRATIONS = [
+    """
+    CREATE TABLE IF NOT EXISTS batches (
+        batch_id TEXT PRIMARY KEY,
+        dispatcher_phone TEXT,
+        upload_time TEXT,
+        meta TEXT NOT NULL DEFAULT '{}'
+    );
+    CREATE TABLE IF NOT EXISTS deliveries (
+        batch_id TEXT NOT NULL REFERENCES batches(batch_id) ON DELETE CASCADE,
+        idx INTEGER NOT NULL,
+        recipient_phone TEXT,
+        data TEXT NOT NULL,
+        PRIMARY KEY (batch_id, idx)
+    );
+    CREATE INDEX IF NOT EXISTS ix_deliveries_phone ON deliveries(recipient_phone);
+    CREATE INDEX IF NOT EXISTS ix_batches_dispatcher ON batches(dispatcher_phone);
+    """,
+    # אינדקס טלפון-מנורמל -> משלוח פעיל אחרון, כדי שחיפוש ב-webhook לא יהיה תלוי בכמות ההיסטוריה
+    """
+    ALTER TABLE deliveries ADD COLUMN phone_key TEXT;
+    ALTER TABLE deliveries ADD COLUMN active INTEGER NOT NULL DEFAULT 1;
+    CREATE INDEX IF NOT EXISTS ix_deliveries_phone_key ON deliveries(phone_key, active DESC, batch_id DESC, idx);
+    """,
+    _backfill_phone_index,
+    # מספר גרסה לכל משלוח - לעדכון אופטימי (compare-and-set) בין כמה workers
+    """
+    ALTER TABLE deliveries ADD COLUMN version INTEGER NOT NULL DEFAULT 0;
+    """,
+    # גרסה גלובלית של ה-store: כל כתיבה מקדמת אותה ומסמנת את השורות ששונו (updated_seq),
+    # כך שמסך השליח יכול למשוך רק את מה שהשתנה מאז הגרסה שכבר יש לו
+    """
+    CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+    INSERT OR IGNORE INTO counters (name, value) VALUES ('store_version', 0);
+    ALTER TABLE deliveries ADD COLUMN updated_seq INTEGER NOT NULL DEFAULT 0;
+    CREATE INDEX IF NOT EXISTS ix_deliveries_updated ON deliveries(updated_seq);
+    """,
+    # אינדקס למשלוחים שעברו לארכיון (retention.py): טלפון -> באיזה קובץ יומי הם נמצאים
+    """
+    CREATE TABLE IF NOT EXISTS archive_index (
+        phone_key TEXT NOT NULL,
+        day TEXT NOT NULL,
+        batch_id TEXT NOT NULL,
+        idx INTEGER NOT NULL,
+        PRIMARY KEY (phone_key, batch_id, idx)
+    );
+    CREATE INDEX IF NOT EXISTS ix_archive_day ON archive_index(day);
+    """,
+]
+
+_BATCH_COLUMNS = ("dispatcher_phone", "upload_time", "deliveries")
+
+
+# ========= חיבור וסכימה =========
+
+def _connect() -> sqlite3.Connection:
+    """
+    מחזיר חיבור SQLite לכל thread (ולכל קובץ DB). החיבור פתוח במצב WAL כך שקוראים לא חוסמים כותבים.
+    """
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+
+    conn = conns.get(DB_FILE)
+    if conn is None:
+        conn = sqlite3.connect(DB_FILE, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        _migrate_schema(conn)
+        conns[DB_FILE] = conn
+        _auto_migrate_legacy(conn)
+    return conn
+
+
+def _migrate_schema(conn: sqlite3.Connection):
+    if conn.execute("PRAGMA user_version").fetchone()[0] >= len(_MIGRATIONS):
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        # קוראים שוב אחרי שתפסנו את נעילת הכתיבה: חיבור אחר (thread / process) אולי כבר הריץ חלק מהשלבים,
+        # ו-ALTER TABLE שרץ פעמיים נכשל. כל השלבים רצים באותה טרנזקציה - או כולם או כלום
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        for i, step in enumerate(_MIGRATIONS[version:], start=version + 1):
+            if callable(step):
+                step(conn)
+            else:
+                for statement in step.split(";"):
+                    if statement.strip():
+                        conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {i}")
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+@contextmanager
+def _transaction():
+    """
+    טרנזקציית כתיבה. BEGIN IMMEDIATE תופס את נעילת הכתיבה מראש כדי לא להיתקע באמצע.
+    """
+    conn = _connect()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    else:
+        conn.execute("COMMIT")
+
+
+def close():
+    """
+    סוגר את החיבורים של ה-thread הנוכחי (שימושי בבדיקות ובסקריפטים).
+    """
+    for conn in getattr(_local, "conns", {}).values():
+        conn.close()
+    _local.conns = {}
+
+
+# ========= המרות שורה <-> מילון =========
+
+def _dumps(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+def _delivery_row(batch_id: str, idx: int, delivery: Dict[str, Any]) -> Tuple:
+    phone = delivery.get("recipient_phone")
+    # "version" מגיע מהעמודה ולא נשמר בתוך ה-JSON
+    data = {k: v for k, v in delivery.items() if k != "version"}
+    return (batch_id, idx, phone, _phone_key(phone), _is_active(delivery), _dumps(data))
+
+
+def _delivery_from_row(row: sqlite3.Row) -> Dict[str, Any]:
+    delivery = json.loads(row["data"])
+    delivery["version"] = row["version"]
+    return delivery
+
+
+def _batch_row(batch_id: str, batch: Dict[str, Any]) -> Tuple:
+    meta = {k: v for k, v in batch.items() if k not in _BATCH_COLUMNS}
+    # טלפון השליח נשמר מנורמל, כדי שהשאילתות של מסך השליח ישוו אותו כמו שהוא
+    return (batch_id, _phone_key(batch.get("dispatcher_phone")), batch.get("upload_time"), _dumps(meta))
+
+
+def _bump_version(conn: sqlite3.Connection) -> int:
+    return conn.execute(
+        "UPDATE counters SET value = value + 1 WHERE name = 'store_version' RETURNING value").fetchone()[0]
+
+
+def _write_batch(conn: sqlite3.Connection, batch_id: str, batch: Dict[str, Any]):
+    seq = _bump_version(conn)
+    conn.execute(
+        "INSERT INTO batches (batch_id, dispatcher_phone, upload_time, meta) VALUES (?, ?, ?, ?) "
+        "ON CONFLICT(batch_id) DO UPDATE SET dispatcher_phone=excluded.dispatcher_phone, "
+        "upload_time=excluded.upload_time, meta=excluded.meta",
+        _batch_row(batch_id, batch),
+    )
+    deliveries = batch.get("deliveries", [])
+    conn.execute("DELETE FROM deliveries WHERE batch_id = ? AND idx >= ?", (batch_id, len(deliveries)))
+    conn.executemany(
+        "INSERT INTO deliveries (batch_id, idx, recipient_phone, phone_key, active, data, updated_seq) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?) "
+        "ON CONFLICT(batch_id, idx) DO UPDATE SET recipient_phone=excluded.recipient_phone, "
+        "phone_key=excluded.phone_key, active=excluded.active, data=excluded.data, version=version + 1, "
+        "updated_seq=excluded.updated_seq",
+        [_delivery_row(batch_id, i, d) + (seq,) for i, d in enumerate(deliveries)],
+    )
+
+
+def _batch_from_row(row: sqlite3.Row) -> Dict[str, Any]:
+    batch = {"dispatcher_phone": row["dispatcher_phone"], "upload_time": row["upload_time"]}
+    batch.update(json.loads(row["meta"]))
+    batch["deliveries"] = []
+    return batch
+
+
+# ========= API ברמת כל הנתונים (תאימות ל-load_data/save_data) =========
+
+def load_all() -> Dict[str, Dict[str, Any]]:
+    """
+    בונה מחדש את המבנה הישן {batch_id: {..., "deliveries": [...]}} מתוך ה-DB.
+    """
+    conn = _connect()
+    batches = {row["batch_id"]: _batch_from_row(row)
+               for row in conn.execute("SELECT * FROM batches ORDER BY batch_id")}
+    for row in conn.execute("SELECT batch_id, data, version FROM deliveries ORDER BY batch_id, idx"):
+        batch = batches.get(row["batch_id"])
+        if batch is not None:
+            batch["deliveries"].append(_delivery_from_row(row))
+    return batches
+
+
+def save_all(data: Dict[str, Dict[str, Any]]):
+    """
+    שומר את כל המבנה בטרנזקציה אחת. מסלולים שלא מופיעים ב-data נמחקים (כמו דריסת הקובץ בעבר).
+    לעדכון משלוח בודד או מסלול בודד עדיף update_delivery / save_batch.
+    """
+    with _transaction() as conn:
+        existing = {row[0] for row in conn.execute("SELECT batch_id FROM batches")}
+        for batch_id in existing - set(data):
+            conn.execute("DELETE FROM batches WHERE batch_id = ?", (batch_id,))
+        for batch_id, batch in data.items():
+            _write_batch(conn, batch_id, batch)
+
+
+# ========= API לפי מסלול / משלוח =========
+
+def get_batch(batch_id: str) -> Optional[Dict[str, Any]]:
+    conn = _connect()
+    row = conn.execute("SELECT * FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()
+    if row is None:
+        return None
+    batch = _batch_from_row(row)
+    batch["deliveries"] = [_delivery_from_row(r) for r in conn.execute(
+        "SELECT data, version FROM deliveries WHERE batch_id = ? ORDER BY idx", (batch_id,))]
+    return batch
+
+
+def save_batch(batch_id: str, batch: Dict[str, Any]):
+    """
+    יוצר או מחליף מסלול אחד בלבד, בלי לגעת בשאר המסלולים.
+    """
+    with _transaction() as conn:
+        _write_batch(conn, batch_id, batch)
+
+
+def get_dispatcher_phone(batch_id: str) -> Optional[str]:
+    row = _connect().execute("SELECT dispatcher_phone FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()
+    return row["dispatcher_phone"] if row else None
+
+
+def get_delivery(batch_id: str, idx: int) -> Optional[Dict[str, Any]]:
+    row = _connect().execute(
+        "SELECT data, version FROM deliveries WHERE batch_id = ? AND idx = ?", (batch_id, int(idx))).fetchone()
+    return _delivery_from_row(row) if row else None
+
+
+def update_delivery(batch_id: str, idx: int, delivery: Dict[str, Any],
+                    expected_version: Optional[int] = None) -> bool:
+    """
+    מעדכן משלוח בודד ומקדם את מספר הגרסה שלו (delivery["version"] מתעדכן בהתאם).
+    אם expected_version הועבר, העדכון מתבצע רק אם אף אחד אחר לא כתב למשלוח מאז שנקרא
+    (עדכון אופטימי). מחזיר False אם המשלוח לא קיים או שהגרסה השתנתה - ואז צריך לקרוא מחדש ולנסות שוב.
+    """
+    _, _, phone, key, active, data = _delivery_row(batch_id, int(idx), delivery)
+    sql = ("UPDATE deliveries SET recipient_phone = ?, phone_key = ?, active = ?, data = ?, version = version + 1, "
+           "updated_seq = ? WHERE batch_id = ? AND idx = ?")
+    params = [phone, key, active, data, None, batch_id, int(idx)]
+    if expected_version is not None:
+        sql += " AND version = ?"
+        params.append(expected_version)
+    with _transaction() as conn:
+        params[4] = _bump_version(conn)
+        row = conn.execute(sql + " RETURNING version", params).fetchone()
+    if row is None:
+        return False
+    delivery["version"] = row[0]
+    return True
+
+
+def update_delivery_fields(batch_id: str, changes: Dict[int, Dict[str, Any]]) -> int:
+    """
+    מעדכן שדות בודדים בכמה משלוחים של אותו מסלול ({idx: {שדה: ערך}}), בטרנזקציה אחת.
+    כל משלוח נקרא מחדש בתוך הטרנזקציה ורק השדות שהועברו משתנים, כך שלא נדרס עדכון מקביל
+    (למשל תשובה של לקוח). מחזיר כמה משלוחים עודכנו.
+    """
+    if not changes:
+        return 0
+    updated = 0
+    with _transaction() as conn:
+        seq = _bump_version(conn)
+        for idx, fields in changes.items():
+            row = conn.execute(
+                "SELECT data FROM deliveries WHERE batch_id = ? AND idx = ?", (batch_id, int(idx))).fetchone()
+            if row is None:
+                continue
+            delivery = json.loads(row["data"])
+            delivery.update(fields)
+            _, _, phone, key, active, data = _delivery_row(batch_id, int(idx), delivery)
+            conn.execute(
+                "UPDATE deliveries SET recipient_phone = ?, phone_key = ?, active = ?, data = ?, "
+                "version = version + 1, updated_seq = ? WHERE batch_id = ? AND idx = ?",
+                (phone, key, active, data, seq, batch_id, int(idx)),
+            )
+            updated += 1
+    return updated
+
+
+def find_deliveries_by_phone(phone: str) -> List[Tuple[str, int, Dict[str, Any]]]:
+    """
+    מחזיר את כל המשלוחים של טלפון נמען, מהמסלול החדש לישן, כרשימת (batch_id, idx, delivery).
+    """
+    rows = _connect().execute(
+        "SELECT batch_id, idx, data, version FROM deliveries WHERE phone_key = ? ORDER BY batch_id DESC, idx",
+        (_phone_key(phone),),
+    )
+    return [(r["batch_id"], r["idx"], _delivery_from_row(r)) for r in rows]
+
+
+def find_active_delivery(phone: str) -> Optional[Tuple[str, int, Dict[str, Any]]]:
+    """
+    מחזיר את המשלוח הפעיל (לא "מלא" / "נמסר") מהמסלול החדש ביותר של הטלפון. אם אין משלוח פעיל -
+    את המשלוח האחרון שלו, כדי שהלקוח עדיין יקבל מענה. שאילתה אחת על האינדקס, בלי סריקה.
+    """
+    row = _connect().execute(
+        "SELECT batch_id, idx, data, version FROM deliveries WHERE phone_key = ? "
+        "ORDER BY active DESC, batch_id DESC, idx LIMIT 1",
+        (_phone_key(phone),),
+    ).fetchone()
+    return (row["batch_id"], row["idx"], _delivery_from_row(row)) if row else None
+
+
+# ========= שאילתות למסך השליח =========
+
+def get_store_version() -> int:
+    """
+    מספר שעולה בכל כתיבה ל-store. אם לא השתנה - אין מה לטעון מחדש.
+    """
+    return _connect().execute("SELECT value FROM counters WHERE name = 'store_version'").fetchone()[0]
+
+
+def query_dispatcher_deliveries(dispatcher_phone: str,
+                                active_only: bool = True,
+                                date_from: Optional[str] = None,
+                                date_to: Optional[str] = None,
+                                changed_since: Optional[int] = None) -> List[Tuple[str, int, Dict[str, Any]]]:
+    """
+    המשלוחים של שליח אחד כרשימת (batch_id, idx, delivery), מהמסלול החדש לישן.
+    active_only - רק מסלולים שיש בהם לפחות משלוח אחד שעוד לא "מלא" / "נמסר".
+    date_from / date_to - טווח תאריכים (YYYYMMDD, כולל) לפי התאריך שב-batch_id (ROUTE-YYYYMMDD-HHMMSS).
+    changed_since - רק משלוחים שהשתנו אחרי גרסת store מסוימת (לרענון הדרגתי).
+    """
+    sql = ["SELECT d.batch_id, d.idx, d.data, d.version FROM batches b JOIN deliveries d ON d.batch_id = b.batch_id",
+           "WHERE b.dispatcher_phone = ?"]
+    params: List[Any] = [dispatcher_phone]
+    if active_only:
+        sql.append("AND EXISTS (SELECT 1 FROM deliveries a WHERE a.batch_id = b.batch_id AND a.active = 1)")
+    if date_from:
+        sql.append("AND b.batch_id >= ?")
+        params.append(f"ROUTE-{date_from}")
+    if date_to:
+        # "ROUTE-YYYYMMDD." גדול מכל "ROUTE-YYYYMMDD-HHMMSS" של אותו יום
+        sql.append("AND b.batch_id < ?")
+        params.append(f"ROUTE-{date_to}.")
+    if changed_since is not None:
+        sql.append("AND d.updated_seq > ?")
+        params.append(changed_since)
+    sql.append("ORDER BY d.batch_id DESC, d.idx")
+    rows = _connect().execute(" ".join(sql), params)
+    return [(r["batch_id"], r["idx"], _delivery_from_row(r)) for r in rows]
+
+
+# ========= ארכיון (retention) =========
+
+def retention_candidates(closed_before: str, expired_before: str) -> List[str]:
+    """
+    מסלולים שיוצאים מהטבלאות החמות: סגורים (אין בהם משלוח פעיל) שנוצרו לפני closed_before,
+    וכל מסלול שנוצר לפני expired_before. הזמנים בפורמט של ה-batch_id: YYYYMMDD-HHMMSS.
+    """
+    rows = _connect().execute(
+        "SELECT batch_id FROM batches b WHERE b.batch_id LIKE 'ROUTE-%' AND (b.batch_id < ? OR "
+        "(b.batch_id < ? AND NOT EXISTS (SELECT 1 FROM deliveries d WHERE d.batch_id = b.batch_id AND d.active = 1))) "
+        "ORDER BY b.batch_id",
+        (f"ROUTE-{expired_before}", f"ROUTE-{closed_before}"),
+    )
+    return [r[0] for r in rows]
+
+
+def archive_batch(batch_id: str, write_archive: Callable[[str, Dict[str, Any]], str]) -> bool:
+    """
+    מוציא מסלול אחד מה-DB: write_archive(batch_id, batch) כותב אותו לארכיון ומחזיר את היום (YYYYMMDD),
+    ורק אם הכתיבה הצליחה המסלול נמחק ונרשם באינדקס הארכיון. הכל בתוך טרנזקציית כתיבה אחת,
+    כך שעדכון מקביל של משלוח לא יכול להיכנס בין הקריאה למחיקה (ולהימחק בלי להגיע לארכיון).
+    """
+    with _transaction() as conn:
+        row = conn.execute("SELECT * FROM batches WHERE batch_id = ?", (batch_id,)).fetchone()
+        if row is None:
+            return False
+        batch = _batch_from_row(row)
+        keys = []
+        for r in conn.execute("SELECT idx, phone_key, data FROM deliveries WHERE batch_id = ? ORDER BY idx",
+                              (batch_id,)):
+            batch["deliveries"].append(json.loads(r["data"]))
+            if r["phone_key"]:
+                keys.append((r["phone_key"], r["idx"]))
+        day = write_archive(batch_id, batch)
+        conn.executemany(
+            "INSERT OR REPLACE INTO archive_index (phone_key, day, batch_id, idx) VALUES (?, ?, ?, ?)",
+            [(key, day, batch_id, idx) for key, idx in keys],
+        )
+        conn.execute("DELETE FROM batches WHERE batch_id = ?", (batch_id,))
+        _bump_version(conn)
+    return True
+
+
+def find_archived(phone: str) -> List[Tuple[str, str, int]]:
+    """
+    איפה נמצאים המשלוחים של טלפון בארכיון: רשימת (day, batch_id, idx), מהחדש לישן.
+    """
+    rows = _connect().execute(
+        "SELECT day, batch_id, idx FROM archive_index WHERE phone_key = ? ORDER BY batch_id DESC, idx",
+        (_phone_key(phone),),
+    )
+    return [(r["day"], r["batch_id"], r["idx"]) for r in rows]
+
+
+def compact(vacuum: bool = False):
+    """
+    מחזיר מקום אחרי ארכוב: מעביר את ה-WAL לקובץ הראשי ומקצץ אותו. vacuum=True גם בונה את הקובץ מחדש
+    (חוסם כתיבות לכמה רגעים - מתאים לשעות שקטות).
+    """
+    conn = _connect()
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    if vacuum:
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+
+
+# ========= מיגרציה מ-data.json =========
+
+def migrate_json(json_path: str = LEGACY_JSON_FILE, rename: bool = True) -> int:
+    """
+    מייבא קובץ data.json ישן ל-DB בטרנזקציה אחת ומחזיר כמה משלוחים יובאו.
+    אחרי הצלחה הקובץ משנה שם ל-<name>.migrated כדי שהמיגרציה לא תרוץ פעמיים.
+    """
+    with open(json_path, "r", encoding="utf8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        data = {}
+
+    count = 0
+    with _transaction() as conn:
+        for batch_id, batch in data.items():
+            if not isinstance(batch, dict):
+                continue
+            _write_batch(conn, batch_id, batch)
+            count += len(batch.get("deliveries", []))
+
+    if rename:
+        os.replace(json_path, json_path + ".migrated")
+    return count
+
+
+def _auto_migrate_legacy(conn: sqlite3.Connection):
+    # מיגרציה חד-פעמית אוטומטית: רק אם ה-DB ריק וקיים data.json ישן ליד
+    if not AUTO_MIGRATE or not os.path.exists(LEGACY_JSON_FILE):
+        return
+    if conn.execute("SELECT 1 FROM batches LIMIT 1").fetchone():
+        return
+    try:
+        count = migrate_json(LEGACY_JSON_FILE)
+        print(f"✅ יובאו {count} משלוחים מ-{LEGACY_JSON_FILE} אל {DB_FILE}")
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"❌ שגיאה במיגרציה של {LEGACY_JSON_FILE}:", e)
+
+
+if __name__ == "__main__":
+    # שימוש: python store.py migrate [data.json]
+    if len(sys.argv) >= 2 and sys.argv[1] == "migrate":
+        path = sys.argv[2] if len(sys.argv) > 2 else LEGACY_JSON_FILE
+        AUTO_MIGRATE = False
+        print(f"✅ יובאו {migrate_json(path)} משלוחים מ-{path} אל {DB_FILE}")
+    else:
+        print("usage: python store.py migrate [data.json]")
@@ -1,112 +1,295 @@
-from fastapi import FastAPI, Request
+from fastapi import Depends, FastAPI, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+import asyncio
+import hmac
 import json
+import time
 import uvicorn
-from datetime import datetime
+import weakref
+from contextlib import asynccontextmanager
 from typing import Dict, Any
 import os 
 
+import store
+from ai_cache import ai_cache
+from dedup import create_deduplicator, message_key
+from fast_parser import DROP_OFF_KEYWORDS, fast_parse
+from live_events import EventBus
+from retention import RETENTION_INTERVAL_SECONDS, run_retention
+from metrics import (
+    REGISTRY, CONTENT_TYPE, gauge, log_event, messages_processed, new_trace_id, reply_source,
+    stage_seconds, trace_id_var, webhook_requests
+)
+from work_queue import Job, WorkerPool, create_queue
 from services import (
-    load_data, 
-    save_data, 
-    analyze_text_with_ai, 
-    send_whatsapp_message,
+    ai_usage,
+    analyze_text_with_ai_async, 
+    send_whatsapp_message_async,
+    init_async_clients,
+    close_async_clients,
     normalize_phone
 )
 
-app = FastAPI()
-recent_messages = {}
-
-def is_duplicate_message(phone: str, message: str) -> bool:
-    now = datetime.now()
-    message_id = hash(message)
-    if phone not in recent_messages: recent_messages[phone] = {}
-    recent_messages[phone] = {m: t for m, t in recent_messages[phone].items() if (now - t).total_seconds() < 120}
-    if message_id in recent_messages[phone] and (now - recent_messages[phone][message_id]).total_seconds() < 60: return True
-    recent_messages[phone][message_id] = now
-    return False
-
-def find_and_update_delivery(all_batches, phone):
-    norm_phone = phone.lstrip("972")
-    for bid, bdata in all_batches.items():
-        for i, d in enumerate(bdata["deliveries"]):
-            if normalize_phone(str(d.get("recipient_phone"))).lstrip("972") == norm_phone:
-                return d, bid, str(i)
-    return None, None, None
+# התור וה-workers נוצרים ב-lifespan. ה-webhook רק מכניס לתור ומחזיר תשובה מיד.
+work_queue = None
+worker_pool = None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global work_queue, worker_pool
+    # לקוחות HTTP/OpenAI משותפים עם connection pool - נוצרים פעם אחת לכל process
+    await init_async_clients()
+    work_queue = create_queue()
+    worker_pool = WorkerPool(work_queue, handle_job)
+    worker_pool.start()
+    retention_task = asyncio.create_task(retention_loop()) if RETENTION_INTERVAL_SECONDS > 0 else None
+    yield
+    if retention_task is not None:
+        retention_task.cancel()
+    await worker_pool.stop()
+    work_queue.close()
+    await close_async_clients()
+    if ai_cache is not None:
+        ai_cache.save()
+
+async def retention_loop():
+    # מעביר מסלולים סגורים / ישנים לארכיון, כדי שה-DB החם יכיל רק מסלולים פעילים
+    while True:
+        await asyncio.sleep(RETENTION_INTERVAL_SECONDS)
+        try:
+            with stage_seconds.time(stage="retention"):
+                result = await run_in_threadpool(run_retention)
+            if result["archived"]:
+                log_event("retention", archived=result["archived"], deliveries=result["deliveries"])
+        except Exception as e:
+            log_event("retention_error", "error", error=repr(e))
+
+app = FastAPI(lifespan=lifespan)
+
+# עדכונים חיים למסך השליח (SSE ב-/events)
+event_bus = EventBus()
+
+# זיהוי webhooks כפולים (Green API שולח שוב כשאנחנו איטיים). DEDUP_BACKEND=sqlite משותף לכל ה-workers.
+deduplicator = create_deduplicator()
+
+# מדדים שנקראים בזמן ה-scrape של /metrics
+gauge("queue_depth", "Messages waiting in the work queue", lambda: work_queue.depth() if work_queue else None)
+gauge("dedup_entries", "Message keys currently held by the deduplicator", lambda: len(deduplicator))
+gauge("ai_cache_entries", "Entries in the AI response cache", lambda: len(ai_cache) if ai_cache is not None else None)
+
+# סוד משותף ל-endpoints הפנימיים (/events, /queue/stats, /ai/...): השרת חשוף לאינטרנט בשביל Green API,
+# ו-/events מחזיר טלפונים, דירות וקודי כניסה. בלי INTERNAL_API_TOKEN ה-endpoints האלה סגורים לגמרי.
+INTERNAL_API_TOKEN = os.environ.get("INTERNAL_API_TOKEN", "")
+
+def require_internal_token(request: Request):
+    auth = request.headers.get("authorization", "")
+    token = auth[len("Bearer "):] if auth.startswith("Bearer ") else request.query_params.get("token", "")
+    if not INTERNAL_API_TOKEN:
+        raise HTTPException(status_code=403, detail="internal endpoints are disabled (INTERNAL_API_TOKEN not set)")
+    if not hmac.compare_digest(token.encode("utf8"), INTERNAL_API_TOKEN.encode("utf8")):
+        raise HTTPException(status_code=401, detail="invalid token")
+
+# כמה פעמים לנסות שוב עדכון שנכשל בגלל כתיבה מקבילה (worker אחר / app.py)
+MAX_UPDATE_RETRIES = int(os.environ.get("MAX_UPDATE_RETRIES", 5))
+
+# נעילה לכל טלפון: הודעות של אותו לקוח מטופלות אחת-אחת, לקוחות שונים במקביל
+_phone_locks = weakref.WeakValueDictionary()
+
+def get_phone_lock(phone: str) -> asyncio.Lock:
+    lock = _phone_locks.get(phone)
+    if lock is None:
+        lock = _phone_locks[phone] = asyncio.Lock()
+    return lock
+
+def is_duplicate_message(phone: str, message: str, message_id: str = None) -> bool:
+    return deduplicator.check_and_add(message_key(phone, message, message_id))
+
+def find_and_update_delivery(phone):
+    match = store.find_active_delivery(phone)
+    if not match:
+        return None, None, None
+    bid, i, d = match
+    return d, bid, i
+
+def build_current_state(delivery: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "someone_home": delivery.get("someone_home"),
+        "drop_location": delivery.get("drop_location"),
+        "apartment": delivery.get("apartment"),
+        "floor": delivery.get("floor"),
+        "entrance_code": delivery.get("entrance_code")
+    }
+
+def apply_extracted_data(delivery: Dict[str, Any], text: str, extracted: Dict[str, Any]):
+    """
+    מחיל על המשלוח את מה שה-AI חילץ ומעדכן סטטוס. פונקציה טהורה על המילון,
+    כדי שאפשר יהיה להריץ אותה שוב על עותק טרי אם היה עדכון מקביל.
+    """
+    delivery["last_message"] = text
+    
+    data_changed = False
+    for key, val in extracted.items():
+        if val is not None and val != delivery.get(key):
+            delivery[key] = val
+            data_changed = True
+    
+    # משלוח שהשליח כבר סימן כנמסר נשאר נמסר - רק שומרים את מה שהלקוח כתב
+    if delivery.get("status") == store.DELIVERED_STATUS:
+        return
+    
+    # בדיקה אם סיימנו (לצורך סטטוס ב-DB)
+    is_finished = False
+    if delivery.get("someone_home") == "yes":
+        is_finished = True
+    elif delivery.get("drop_location") and any(x in str(delivery.get("drop_location")) for x in DROP_OFF_KEYWORDS):
+        is_finished = True
+        if not delivery.get("apartment"): delivery["apartment"] = "-"
+        if not delivery.get("floor"): delivery["floor"] = "-"
+        if not delivery.get("entrance_code"): delivery["entrance_code"] = "-"
+    elif delivery.get("apartment") and delivery.get("floor") and delivery.get("entrance_code"):
+        is_finished = True
+        
+    if is_finished:
+        delivery["status"] = "מלא"
+    elif data_changed: 
+        delivery["status"] = "בתיאום"
+
+def save_with_retry(batch_id: str, idx: int, delivery: Dict[str, Any], text: str, extracted: Dict[str, Any]):
+    """
+    שומר בעדכון אופטימי: אם מישהו אחר כתב למשלוח בזמן שחיכינו ל-AI, קוראים אותו מחדש
+    ומחילים עליו שוב את השינויים, במקום לדרוס את העדכון שלו. מחזיר את המשלוח כפי שנשמר, או None.
+    """
+    for _ in range(MAX_UPDATE_RETRIES):
+        expected_version = delivery.get("version")
+        apply_extracted_data(delivery, text, extracted)
+        if store.update_delivery(batch_id, idx, delivery, expected_version=expected_version):
+            return delivery
+        delivery = store.get_delivery(batch_id, idx)
+        if delivery is None:
+            return None
+    log_event("update_conflict", "error", batch_id=batch_id, idx=idx, retries=MAX_UPDATE_RETRIES)
+    return None
+
+async def publish_delivery_change(batch_id: str, idx: int, delivery: Dict[str, Any]):
+    dispatcher_phone = await run_in_threadpool(store.get_dispatcher_phone, batch_id)
+    if dispatcher_phone:
+        event_bus.publish(dispatcher_phone, {"batch_id": batch_id, "idx": idx, "delivery": delivery})
+
+async def process_message(phone: str, text: str) -> str:
+    """
+    הטיפול המלא בהודעה (רץ ב-worker מהתור): איתור משלוח, ניתוח AI, עדכון ושליחת תשובה.
+    """
+    async with get_phone_lock(phone):
+        with stage_seconds.time(stage="find_delivery"):
+            delivery, batch_id, idx = await run_in_threadpool(find_and_update_delivery, phone)
+        
+        if not delivery: return "not_found"
+        
+        # === תשובות פשוטות (כן/לא/לובי/קומה...) בלי AI, וכל השאר - ה-AI מנהל את השיחה ===
+        current_state = build_current_state(delivery)
+        with stage_seconds.time(stage="fast_parse"):
+            ai_response = fast_parse(text, current_state)
+        if ai_response:
+            reply_source.inc(source="fast_path")
+        else:
+            with stage_seconds.time(stage="ai"):
+                ai_response = await analyze_text_with_ai_async(text, current_state)
+        
+        # 1. עדכון נתונים ושמירה (לפני התשובה, כדי שהמצב יישמר גם אם השליחה נכשלת)
+        extracted = ai_response.get("extracted_data") or {}
+        with stage_seconds.time(stage="save"):
+            saved = await run_in_threadpool(save_with_retry, batch_id, idx, delivery, text, extracted)
+        if saved:
+            # רק השורה שהשתנתה נשלחת למסך השליח
+            with stage_seconds.time(stage="publish"):
+                await publish_delivery_change(batch_id, idx, saved)
+        
+        # 2. שליחת התגובה שה-AI ניסח
+        reply_message = ai_response.get("reply_message")
+        if reply_message:
+            with stage_seconds.time(stage="send_reply"):
+                await send_whatsapp_message_async(phone, reply_message)
+    
+    return "ok" if saved else "error"
+
+async def handle_job(job: Job):
+    trace_id_var.set(job.payload.get("trace_id") or new_trace_id())
+    queue_wait = max(0.0, time.time() - job.enqueued_at)
+    stage_seconds.observe(queue_wait, stage="queue_wait")
+    started = time.perf_counter()
+    try:
+        status = await process_message(job.phone, job.payload["text"])
+    except Exception:
+        messages_processed.inc(status="error")
+        raise
+    finally:
+        stage_seconds.observe(time.perf_counter() - started, stage="process")
+    messages_processed.inc(status=status)
+    log_event("message_processed", "info" if status == "ok" else "warning", phone=job.phone, status=status,
+              queue_wait_ms=round(queue_wait * 1000, 1), duration_ms=round((time.perf_counter() - started) * 1000, 1))
 
 @app.post("/webhook")
 async def whatsapp_webhook(request: Request):
+    # מזהה מעקב להודעה - עובר עם ה-Job לתור, כך שכל שורות הלוג של אותה הודעה מקושרות
+    trace_id_var.set(new_trace_id())
+    with stage_seconds.time(stage="webhook"):
+        status = await receive_webhook(request)
+    webhook_requests.inc(status=status)
+    return {"status": status}
+
+async def receive_webhook(request: Request) -> str:
     try:
         payload = await request.json()
         msg_data = payload.get("messageData", {})
-        if msg_data.get("typeMessage") != "textMessage": return {"status": "ignored"}
+        if msg_data.get("typeMessage") != "textMessage": return "ignored"
         
         text = msg_data["textMessageData"]["textMessage"].strip()
         chat_id = payload["senderData"]["chatId"]
         phone = normalize_phone(chat_id.replace("@c.us", ""))
         
-        if is_duplicate_message(phone, text): return {"status": "duplicate"}
-        
-        all_batches = load_data()
-        delivery, batch_id, idx = find_and_update_delivery(all_batches, phone)
-        
-        if not delivery: return {"status": "not_found"}
-        
-        delivery["last_message"] = text
-        
-        # הכנת המצב הנוכחי לשליחה ל-AI
-        current_state = {
-            "someone_home": delivery.get("someone_home"),
-            "drop_location": delivery.get("drop_location"),
-            "apartment": delivery.get("apartment"),
-            "floor": delivery.get("floor"),
-            "entrance_code": delivery.get("entrance_code")
-        }
-        
-        # === ה-AI מנהל את השיחה (בצורה טבעית) ===
-        ai_response = analyze_text_with_ai(text, current_state)
+        with stage_seconds.time(stage="dedup"):
+            duplicate = is_duplicate_message(phone, text, payload.get("idMessage"))
+        if duplicate:
+            log_event("duplicate_message", phone=phone, message_id=payload.get("idMessage"))
+            return "duplicate"
         
-        # 1. עדכון נתונים
-        extracted = ai_response.get("extracted_data", {})
-        data_changed = False
-        for key, val in extracted.items():
-            if val is not None and val != delivery.get(key):
-                delivery[key] = val
-                data_changed = True
-        
-        # בדיקה אם סיימנו (לצורך סטטוס ב-DB)
-        is_finished = False
-        if delivery.get("someone_home") == "yes":
-            is_finished = True
-        elif delivery.get("drop_location") and any(x in str(delivery.get("drop_location")) for x in ["שומר", "לובי", "קבלה"]):
-            is_finished = True
-            if not delivery.get("apartment"): delivery["apartment"] = "-"
-            if not delivery.get("floor"): delivery["floor"] = "-"
-            if not delivery.get("entrance_code"): delivery["entrance_code"] = "-"
-        elif delivery.get("apartment") and delivery.get("floor") and delivery.get("entrance_code"):
-            is_finished = True
-            
-        if is_finished:
-            delivery["status"] = "מלא"
-        elif data_changed: 
-            delivery["status"] = "בתיאום"
-            
-        # 2. שליחת התגובה שה-AI ניסח
-        reply_message = ai_response.get("reply_message")
-        if reply_message:
-            send_whatsapp_message(phone, reply_message)
-            
-        # 3. שמירה
-        all_batches[batch_id]["deliveries"][int(idx)] = delivery
-        save_data(all_batches)
-        
-        return {"status": "ok"}
+        await work_queue.put(Job(phone=phone, payload={"text": text, "trace_id": trace_id_var.get()}))
+        return "queued"
 
     except Exception as e:
-        print("Error:", e)
-        return {"status": "error"}
-        
-    return {"status": "ok"}
+        log_event("webhook_error", "error", error=repr(e))
+        return "error"
+
+@app.get("/events", dependencies=[Depends(require_internal_token)])
+async def delivery_events(request: Request, dispatcher: str):
+    """
+    Server-Sent Events: כל שינוי במשלוח של השליח נשלח כאירוע "delivery" עם השורה המעודכנת.
+    """
+    # מזהה לא מוכר (לא מספר, או מ-process קודם) מקבל אירוע reset - השליח טוען הכל מחדש
+    stream = event_bus.stream(normalize_phone(dispatcher), request.headers.get("last-event-id"))
+    return StreamingResponse(stream, media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+@app.get("/queue/stats", dependencies=[Depends(require_internal_token)])
+async def queue_stats():
+    return work_queue.snapshot()
+
+@app.get("/ai/cache/stats", dependencies=[Depends(require_internal_token)])
+async def ai_cache_stats():
+    return ai_cache.stats() if ai_cache is not None else {"enabled": False}
+
+@app.get("/ai/usage", dependencies=[Depends(require_internal_token)])
+async def ai_usage_stats():
+    calls = ai_usage["calls"] or 1
+    return {**ai_usage, "avg_prompt_tokens": ai_usage["prompt_tokens"] / calls,
+            "avg_completion_tokens": ai_usage["completion_tokens"] / calls,
+            "avg_latency_ms": ai_usage["latency_ms"] / calls}
 
 if __name__ == "__main__":
     port = int(os.environ.get("PORT", 8000))
-    uvicorn.run(app, host="0.0.0.0", port=port)
\ No newline at end of file
+    uvicorn.run(app, host="0.0.0.0", port=port)
@@ -0,0 +1,311 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Deque, Dict, Any, List, Optional, Callable, Awaitable
+
+from metrics import log_event
+
+# ========= הגדרות =========
+
+QUEUE_BACKEND = os.environ.get("QUEUE_BACKEND", "memory")  # memory | sqlite
+QUEUE_DB_FILE = os.environ.get("QUEUE_DB_FILE", "queue.db")
+# workers משותפים לכל הטלפונים; יותר מ-AI_CONCURRENCY כדי שההגבלה בפועל תהיה של ה-AI ולא של התור
+QUEUE_WORKERS = int(os.environ.get("QUEUE_WORKERS", 128))
+QUEUE_POLL_INTERVAL = float(os.environ.get("QUEUE_POLL_INTERVAL", 0.2))
+# אחרי כמה שניות הודעה "בטיפול" נחשבת תקועה (worker שקרס) וחוזרת לתור
+QUEUE_LEASE_SECONDS = float(os.environ.get("QUEUE_LEASE_SECONDS", 120))
+# בכיבוי: כמה שניות לחכות שהתור בזיכרון יתרוקן לפני שעוצרים את ה-workers
+QUEUE_DRAIN_SECONDS = float(os.environ.get("QUEUE_DRAIN_SECONDS", 20))
+
+
+@dataclass
+class Job:
+    phone: str
+    payload: Dict[str, Any]
+    enqueued_at: float = field(default_factory=time.time)
+    id: Optional[int] = None
+
+
+class QueueStats:
+    """
+    מונים לתור: עומק, כמה בטיפול, וזמן ההמתנה בתור (processing lag) של הודעות שנלקחו.
+    """
+
+    def __init__(self):
+        self.enqueued = 0
+        self.processed = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.last_lag = 0.0
+        self.max_lag = 0.0
+        self._lag_total = 0.0
+        self._lag_count = 0
+
+    def picked(self, job: Job):
+        lag = max(0.0, time.time() - job.enqueued_at)
+        self.in_flight += 1
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        self._lag_total += lag
+        self._lag_count += 1
+
+    def finished(self, ok: bool):
+        self.in_flight -= 1
+        if ok:
+            self.processed += 1
+        else:
+            self.failed += 1
+
+    def as_dict(self, depth: int) -> Dict[str, Any]:
+        return {
+            "depth": depth,
+            "in_flight": self.in_flight,
+            "enqueued": self.enqueued,
+            "processed": self.processed,
+            "failed": self.failed,
+            "last_lag_seconds": round(self.last_lag, 4),
+            "avg_lag_seconds": round(self._lag_total / self._lag_count, 4) if self._lag_count else 0.0,
+            "max_lag_seconds": round(self.max_lag, 4),
+        }
+
+
+# ========= מימושים =========
+
+class BaseWorkQueue:
+    """
+    ממשק התור. כל worker קורא ל-get עם המספר שלו; הסדר בין הודעות של אותו טלפון נשמר.
+    """
+    # האם הודעות שבתור שורדות restart (אחרת בכיבוי מחכים שהתור יתרוקן)
+    durable = False
+
+    def __init__(self):
+        self.stats = QueueStats()
+
+    async def put(self, job: Job):
+        raise NotImplementedError
+
+    async def get(self, worker_id: int) -> Job:
+        raise NotImplementedError
+
+    async def done(self, job: Job, ok: bool = True):
+        self.stats.finished(ok)
+
+    async def release(self, job: Job):
+        # הודעה שהטיפול בה נקטע (כיבוי) - בתור עמיד היא חוזרת לתור
+        self.stats.in_flight -= 1
+
+    def depth(self) -> int:
+        raise NotImplementedError
+
+    async def join(self):
+        # מחכה שהתור יתרוקן וכל ההודעות יסתיימו (שימושי בבדיקות עומס ובכיבוי)
+        while self.depth() or self.stats.in_flight:
+            await asyncio.sleep(0.01)
+
+    def close(self):
+        pass
+
+    def snapshot(self) -> Dict[str, Any]:
+        return self.stats.as_dict(self.depth())
+
+
+class AsyncioWorkQueue(BaseWorkQueue):
+    """
+    תור בזיכרון. כל ה-workers מושכים מתור משותף, ולכל טלפון יש לכל היותר הודעה אחת בתור המשותף
+    או בטיפול - ההודעות הבאות שלו מחכות בשרשרת משלו עד שהקודמת מסתיימת, כך שהסדר נשמר
+    בלי ששיחה איטית אחת (AI) תעכב לקוחות אחרים.
+    הודעות שבתור הולכות לאיבוד אם ה-process נופל.
+    """
+
+    def __init__(self, workers: int = QUEUE_WORKERS):
+        super().__init__()
+        self.workers = workers
+        self._ready: asyncio.Queue = asyncio.Queue()
+        # טלפון -> ההודעות שמחכות לסיום ההודעה הנוכחית שלו (קיים רק כשיש לטלפון הודעה בתור/בטיפול)
+        self._chains: Dict[str, Deque[Job]] = {}
+        self._waiting = 0
+
+    async def put(self, job: Job):
+        self.stats.enqueued += 1
+        chain = self._chains.get(job.phone)
+        if chain is None:
+            self._chains[job.phone] = deque()
+            self._ready.put_nowait(job)
+        else:
+            chain.append(job)
+            self._waiting += 1
+
+    async def get(self, worker_id: int) -> Job:
+        job = await self._ready.get()
+        self.stats.picked(job)
+        return job
+
+    def _advance(self, phone: str):
+        chain = self._chains[phone]
+        if chain:
+            self._waiting -= 1
+            self._ready.put_nowait(chain.popleft())
+        else:
+            del self._chains[phone]
+
+    async def done(self, job: Job, ok: bool = True):
+        self._advance(job.phone)
+        await super().done(job, ok)
+
+    async def release(self, job: Job):
+        # חוזרת לתור המשותף; הטלפון נשאר "תפוס" כך שההודעות הבאות שלו עדיין מחכות לה
+        self._ready.put_nowait(job)
+        await super().release(job)
+
+    def depth(self) -> int:
+        return self._ready.qsize() + self._waiting
+
+
+class SQLiteWorkQueue(BaseWorkQueue):
+    """
+    תור עמיד על SQLite: הודעה נמחקת רק אחרי שטופלה, כך שהיא שורדת קריסה/restart.
+    worker לוקח את ההודעה הוותיקה ביותר שאין לפניה הודעה (ממתינה או בטיפול) של אותו טלפון,
+    כך שהסדר לכל טלפון נשמר גם כשכמה processes צורכים מאותו קובץ.
+    """
+    durable = True
+
+    def __init__(self, path: str = QUEUE_DB_FILE, poll_interval: float = QUEUE_POLL_INTERVAL,
+                 lease_seconds: float = QUEUE_LEASE_SECONDS):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self.lease_seconds = lease_seconds
+        self._wakeup = asyncio.Event()
+        # חיבור אחד שמשמש כמה threads (asyncio.to_thread), לכן מוגן בנעילה
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                phone TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                enqueued_at REAL NOT NULL,
+                started_at REAL
+            );
+            CREATE INDEX IF NOT EXISTS ix_jobs_phone ON jobs(phone, id);
+        """)
+
+    def _execute(self, sql: str, params=()) -> List[tuple]:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def _insert(self, job: Job) -> int:
+        with self._lock:
+            cur = self._conn.execute(
+                "INSERT INTO jobs (phone, payload, enqueued_at) VALUES (?, ?, ?)",
+                (job.phone, json.dumps(job.payload, ensure_ascii=False), job.enqueued_at),
+            )
+            return cur.lastrowid
+
+    def _claim(self) -> Optional[Job]:
+        now = time.time()
+        rows = self._execute(
+            "UPDATE jobs SET started_at = ? WHERE id = ("
+            "  SELECT j.id FROM jobs j"
+            "  WHERE (j.started_at IS NULL OR j.started_at < ?)"
+            "  AND NOT EXISTS (SELECT 1 FROM jobs k WHERE k.phone = j.phone AND k.id < j.id)"
+            "  ORDER BY j.id LIMIT 1"
+            ") RETURNING id, phone, payload, enqueued_at",
+            (now, now - self.lease_seconds),
+        )
+        if not rows:
+            return None
+        row = rows[0]
+        return Job(id=row[0], phone=row[1], payload=json.loads(row[2]), enqueued_at=row[3])
+
+    async def put(self, job: Job):
+        job.id = await asyncio.to_thread(self._insert, job)
+        self.stats.enqueued += 1
+        self._wakeup.set()
+
+    async def get(self, worker_id: int) -> Job:
+        while True:
+            job = await asyncio.to_thread(self._claim)
+            if job is not None:
+                self.stats.picked(job)
+                return job
+            # אין עבודה: מחכים ל-put מקומי או לזמן ה-poll (הודעות שהוכנסו ע"י process אחר)
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def done(self, job: Job, ok: bool = True):
+        await asyncio.to_thread(self._execute, "DELETE FROM jobs WHERE id = ?", (job.id,))
+        await super().done(job, ok)
+
+    async def release(self, job: Job):
+        await asyncio.to_thread(self._execute, "UPDATE jobs SET started_at = NULL WHERE id = ?", (job.id,))
+        await super().release(job)
+
+    def depth(self) -> int:
+        return self._execute("SELECT COUNT(*) FROM jobs WHERE started_at IS NULL")[0][0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def create_queue(backend: str = QUEUE_BACKEND) -> BaseWorkQueue:
+    if backend == "sqlite":
+        return SQLiteWorkQueue()
+    if backend == "memory":
+        return AsyncioWorkQueue()
+    raise ValueError(f"Unknown QUEUE_BACKEND: {backend}")
+
+
+# ========= מאגר workers =========
+
+class WorkerPool:
+    """
+    מריץ workers שמושכים הודעות מהתור ומעבירים אותן ל-handler.
+    """
+
+    def __init__(self, queue: BaseWorkQueue, handler: Callable[[Job], Awaitable[Any]],
+                 workers: int = QUEUE_WORKERS):
+        self.queue = queue
+        self.handler = handler
+        self.workers = getattr(queue, "workers", workers)
+        self._tasks: List[asyncio.Task] = []
+
+    def start(self):
+        self._tasks = [asyncio.create_task(self._run(i)) for i in range(self.workers)]
+
+    async def stop(self, drain_seconds: float = QUEUE_DRAIN_SECONDS):
+        # בתור בזיכרון ההודעות שבתור כבר אושרו (ונרשמו ב-dedup) - מסיימים אותן לפני הכיבוי
+        if not self.queue.durable and drain_seconds > 0:
+            try:
+                await asyncio.wait_for(self.queue.join(), drain_seconds)
+            except asyncio.TimeoutError:
+                log_event("queue_drain_timeout", "warning", **self.queue.snapshot())
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _run(self, worker_id: int):
+        while True:
+            job = await self.queue.get(worker_id)
+            try:
+                await self.handler(job)
+            except asyncio.CancelledError:
+                await self.queue.release(job)
+                raise
+            except Exception as e:
+                log_event("job_failed", "error", phone=job.phone, error=repr(e))
+                await self.queue.done(job, ok=False)
+            else:
+                await self.queue.done(job, ok=True)